@@ -4,26 +4,24 @@ from datetime import datetime, timedelta
 import time
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import geopandas as gpd
 import pytz
 
-# 地図関連のインポート（エラーハンドリング付き）
+# 自動更新コンポーネント（クライアント側でリランを予約し、ワーカースレッドを占有しない）
 try:
-    import folium
-    from streamlit_folium import st_folium
-    FOLIUM_AVAILABLE = True
-    FOLIUM_ERROR = None
-except ImportError as e:
-    FOLIUM_AVAILABLE = False
-    FOLIUM_ERROR = str(e)
-    st_folium = None
+    from streamlit_autorefresh import st_autorefresh
+    AUTOREFRESH_AVAILABLE = True
+except ImportError:
+    AUTOREFRESH_AVAILABLE = False
+    st_autorefresh = None
 
 # 各モジュールのインポート
 from traffic_data import TrafficDataFetcher
 from road_data import RoadDataLoader
 from spatial_processor import SpatialProcessor
 from congestion_analyzer import CongestionAnalyzer
-from map_visualizer import MapVisualizer
 from config import *
 
 # ログ設定
@@ -32,6 +30,20 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+@st.cache_resource(show_spinner=False)
+def _load_map_modules():
+    """地図関連モジュールの遅延読込（map_visualizer・foliumは地図描画時に初めてimportし、プロセス内で共有）
+    
+    Returns:
+        (MapVisualizer, st_folium, エラーメッセージ)。folium系の読込失敗時は st_folium が None
+    """
+    from map_visualizer import MapVisualizer  # foliumもここで読み込まれる
+    try:
+        from streamlit_folium import st_folium
+        return MapVisualizer, st_folium, None
+    except ImportError as e:
+        return MapVisualizer, None, str(e)
+
 def main():
     """メインアプリケーション"""
     st.set_page_config(
@@ -41,11 +53,6 @@ def main():
         initial_sidebar_state="expanded"
     )
     
-    # foliumエラーを表示（ページ設定後）
-    if not FOLIUM_AVAILABLE:
-        st.error(f"地図ライブラリの読み込みエラー: {FOLIUM_ERROR}")
-        st.info("folium と streamlit-folium のインストールが必要です")
-    
     # メインタイトル
     st.title("🚗 センター周辺 交通混雑度マップ")
     st.markdown("---")
@@ -134,9 +141,11 @@ def setup_sidebar():
         
         # 自動更新処理
         if auto_update:
-            st.info("⏱️ 自動更新モード")
-            time.sleep(UPDATE_INTERVAL)
-            st.rerun()
+            if AUTOREFRESH_AVAILABLE:
+                st.info("⏱️ 自動更新モード")
+                st_autorefresh(interval=UPDATE_INTERVAL * 1000, key="traffic_refresh")
+            else:
+                st.warning("自動更新には streamlit-autorefresh のインストールが必要です")
 
 def display_main_content():
     """メインコンテンツ表示"""
@@ -160,6 +169,10 @@ def display_main_content():
     # 地図表示
     st.subheader("🗺️ 交通混雑度マップ")
     
+    _, st_folium, folium_error = _load_map_modules()
+    if st_folium is None:
+        st.error(f"地図ライブラリの読み込みエラー: {folium_error}")
+    
     if traffic_map:
         # 地図表示オプション
         map_height = st.selectbox(
@@ -170,7 +183,7 @@ def display_main_content():
         )
         
         # 地図表示
-        if FOLIUM_AVAILABLE and traffic_map is not None:
+        if st_folium is not None and traffic_map is not None:
             map_data = st_folium(
                 traffic_map, 
                 width=None,  # 自動幅調整
@@ -187,7 +200,7 @@ def display_main_content():
             
     else:
         st.error("🗺️ 地図データの読み込みに失敗しました")
-        if not FOLIUM_AVAILABLE:
+        if st_folium is None:
             st.error("地図ライブラリが利用できません")
         else:
             st.info("基本的な地図を表示します...")
@@ -299,58 +312,22 @@ def display_detailed_statistics(stats: dict):
                 st.write(f"**道路あたり平均観測点数:** {obs_stats.get('mean_per_road', 0):.1f}")
                 st.write(f"**道路あたり最大観測点数:** {obs_stats.get('max_per_road', 0)}")
 
-@st.cache_data(ttl=UPDATE_INTERVAL, show_spinner=False)
 def create_traffic_map():
-    """キャッシュ付きマップ作成"""
+    """マップ作成（データ取得・集約と混雑度分類・描画の2段キャッシュ）"""
     error_message = None
     
     try:
-        # カスタム設定の取得
+        # カスタム設定の取得（キャッシュキー用にタプル化）
         speed_thresholds = st.session_state.get('speed_thresholds', CONGESTION_THRESHOLDS)
+        thresholds = (speed_thresholds['high_speed'], speed_thresholds['medium_speed'])
         
-        # データ処理オブジェクト初期化
-        traffic_fetcher = TrafficDataFetcher(JARTIC_API_URL, API_TIMEOUT)
-        road_loader = RoadDataLoader()
-        spatial_processor = SpatialProcessor(max_distance=200)  # 200mに拡張（道路カバー率向上）
-        congestion_analyzer = CongestionAnalyzer(speed_thresholds)
-        map_visualizer = MapVisualizer(TMDU_CENTER, MAP_ZOOM_LEVEL)
-        
-        # 1. 交通データ取得
-        traffic_data = traffic_fetcher.fetch_traffic_data(BBOX_5KM)
-        if traffic_data is None or traffic_data.empty:
-            return None, {}, "交通データを取得できませんでした。ネットワーク接続を確認してください。"
-        
-        # 2. 道路データ読込
-        road_zip_path = Path(ROAD_DATA_ZIP)
-        # 現在のディレクトリとapp.pyのディレクトリの両方をチェック
-        if not road_zip_path.exists():
-            app_dir = Path(__file__).parent
-            alt_road_zip_path = app_dir / ROAD_DATA_ZIP
-            if alt_road_zip_path.exists():
-                road_zip_path = alt_road_zip_path
-            else:
-                return None, {}, f"道路データファイルが見つかりません: {ROAD_DATA_ZIP}"
+        # 1-4. データ取得・道路ごと集約（しきい値に依存しない）
+        aggregated_data, base_stats, fetched_at, error_message = _fetch_and_aggregate()
+        if error_message:
+            return None, {}, error_message
         
-        road_data = road_loader.load_road_network(road_zip_path, BBOX_5KM)
-        if road_data.empty:
-            return None, {}, "道路データを読み込めませんでした。"
-        
-        # 3. 空間結合
-        joined_data = spatial_processor.join_traffic_roads(traffic_data, road_data)
-        if joined_data.empty:
-            return None, {}, "交通データと道路データの結合に失敗しました。"
-        
-        # 4. 道路ごと集約
-        aggregated_data = spatial_processor.aggregate_by_road(joined_data)
-        if aggregated_data.empty:
-            return None, {}, "道路データの集約に失敗しました。"
-        
-        # 5. 混雑度分析
-        congestion_data = congestion_analyzer.calculate_congestion_level(aggregated_data)
-        stats = congestion_analyzer.generate_statistics(congestion_data)
-        
-        # 6. 地図作成
-        traffic_map = map_visualizer.create_traffic_map(congestion_data, stats)
+        # 5-6. 混雑度分析・地図作成（データ更新・しきい値変更時のみ再実行）
+        traffic_map, stats = _classify_and_render(aggregated_data, base_stats, fetched_at, thresholds)
         
         return traffic_map, stats, None
         
@@ -360,8 +337,107 @@ def create_traffic_map():
         logging.error(traceback.format_exc())
         return None, {}, error_message
 
+@st.cache_data(ttl=UPDATE_INTERVAL, show_spinner=False)
+def _fetch_and_aggregate():
+    """キャッシュ付きデータ取得・道路ごと集約・基本統計（取得時刻を後段のキャッシュキーに使用）"""
+    # データ処理オブジェクト初期化
+    traffic_fetcher = TrafficDataFetcher(JARTIC_API_URL, API_TIMEOUT)
+    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # 1. 交通データ取得（HTTP待ちのため別スレッドで実行）
+        traffic_future = executor.submit(traffic_fetcher.fetch_traffic_data, BBOX_5KM)
+        
+        # 2. 道路データ読込（交通データ取得と並行、キャッシュ利用のためメインスレッドで実行）
+        road_zip_path = _find_road_zip_path()
+        road_data = _load_road_network(str(road_zip_path)) if road_zip_path else None
+        spatial_processor = _get_spatial_processor(str(road_zip_path)) if road_zip_path else None
+        
+        traffic_data = traffic_future.result()
+    
+    if traffic_data is None or traffic_data.empty:
+        return None, None, None, "交通データを取得できませんでした。ネットワーク接続を確認してください。"
+    
+    if road_zip_path is None:
+        return None, None, None, f"道路データファイルが見つかりません: {ROAD_DATA_ZIP}"
+    
+    if road_data.empty:
+        _load_road_network.clear()  # 読込失敗は次回再試行させる
+        _get_spatial_processor.clear()
+        return None, None, None, "道路データを読み込めませんでした。"
+    
+    # 3. 空間結合
+    joined_data = spatial_processor.join_traffic_roads(traffic_data, road_data)
+    if joined_data.empty:
+        return None, None, None, "交通データと道路データの結合に失敗しました。"
+    
+    # 4. 道路ごと集約
+    aggregated_data = spatial_processor.aggregate_by_road(joined_data, road_data)
+    if aggregated_data.empty:
+        return None, None, None, "道路データの集約に失敗しました。"
+    
+    # キャッシュ前に地図表示用の道路形状を簡略化
+    aggregated_data = spatial_processor.simplify_geometries(aggregated_data)
+    
+    # しきい値に依存しない統計（速度・旅行時間・観測点数）はここで1回だけ計算
+    base_stats = CongestionAnalyzer().generate_base_statistics(aggregated_data)
+    
+    # 形状はWKB列のDataFrameとしてキャッシュ（shapelyオブジェクト単位のpickle/unpickleを避ける）
+    return aggregated_data.to_wkb(), base_stats, datetime.now().isoformat(), None
+
+def _gdf_from_wkb(wkb_data):
+    """WKB列のDataFrameからGeoDataFrameを復元（shapely 2のベクトル化from_wkbで一括変換）"""
+    geometry = gpd.GeoSeries.from_wkb(wkb_data['geometry'], crs='EPSG:4326')
+    return gpd.GeoDataFrame(wkb_data.assign(geometry=geometry), geometry='geometry')
+
+def _find_road_zip_path():
+    """道路データZIPのパス取得（現在のディレクトリとapp.pyのディレクトリの両方をチェック）"""
+    road_zip_path = Path(ROAD_DATA_ZIP)
+    if road_zip_path.exists():
+        return road_zip_path
+    
+    alt_road_zip_path = Path(__file__).parent / ROAD_DATA_ZIP
+    if alt_road_zip_path.exists():
+        return alt_road_zip_path
+    
+    return None
+
+@st.cache_resource(show_spinner=False)
+def _load_road_network(road_zip_path: str):
+    """道路データ読込（実行中は変化しないためTTLなしでプロセス内共有、読取専用として扱う）"""
+    road_loader = RoadDataLoader()
+    return road_loader.load_road_network(Path(road_zip_path), BBOX_5KM)
+
+@st.cache_resource(show_spinner=False)
+def _get_spatial_processor(road_zip_path: str):
+    """道路の投影・空間インデックスを構築済みの空間処理オブジェクト（道路データと同じくプロセス内共有）"""
+    spatial_processor = SpatialProcessor(max_distance=200)  # 200mに拡張（道路カバー率向上）
+    spatial_processor.prepare_roads(_load_road_network(road_zip_path))
+    return spatial_processor
+
+@st.cache_data(ttl=UPDATE_INTERVAL, show_spinner=False)
+def _classify_and_render(_aggregated_data, _base_stats: dict, fetched_at: str, thresholds: tuple):
+    """キャッシュ付き混雑度分析・地図作成（集約データはハッシュせず取得時刻で識別）"""
+    high_speed, medium_speed = thresholds
+    congestion_analyzer = CongestionAnalyzer({
+        'high_speed': high_speed,
+        'medium_speed': medium_speed
+    })
+    # 道路形状はキャッシュ前にsimplify_geometriesで簡略化済みのため再簡略化しない
+    MapVisualizer, _, _ = _load_map_modules()
+    map_visualizer = MapVisualizer(TMDU_CENTER, MAP_ZOOM_LEVEL, simplify_tolerance=None)
+    
+    # 5. 混雑度分析（レベル別の件数・割合のみ再計算）
+    congestion_data = congestion_analyzer.calculate_congestion_level(_gdf_from_wkb(_aggregated_data))
+    stats = {**_base_stats, **congestion_analyzer.generate_level_statistics(congestion_data)}
+    
+    # 6. 地図作成
+    traffic_map = map_visualizer.create_traffic_map(congestion_data, stats)
+    
+    return traffic_map, stats
+
 def create_basic_map():
     """基本マップ作成（フォールバック用）"""
+    MapVisualizer, _, _ = _load_map_modules()
     map_visualizer = MapVisualizer(TMDU_CENTER, MAP_ZOOM_LEVEL)
     basic_map = map_visualizer._create_base_map()
     map_visualizer._add_university_marker(basic_map)
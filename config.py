@@ -29,6 +29,9 @@ MAP_ZOOM_LEVEL: int = 13
 MAP_TILES: str = "OpenStreetMap"
 ROAD_LINE_WIDTH: int = 3
 ROAD_LINE_OPACITY: float = 0.8
+ROAD_SIMPLIFY_TOLERANCE: float = 0.00005  # 道路形状の簡略化許容誤差（度、約5m）
+ROAD_COORD_PRECISION: float = 1e-5  # 座標の丸め単位（度、小数点以下5桁）
+ROAD_MIN_DISPLAY_PIXELS: float = 1.0  # 表示する道路の最小長（初期ズームでのピクセル数）
 
 # ファイルパス設定
 ROAD_DATA_ZIP: str = "N01-07L-13-01.0a_GML.zip"
@@ -1,11 +1,58 @@
 """混雑度分析モジュール"""
+from __future__ import annotations
 import pandas as pd
-import geopandas as gpd
-from typing import Dict, Any, Tuple
+from typing import TYPE_CHECKING, Dict, Any, Tuple
 import numpy as np
 import logging
 from config import CONGESTION_COLORS, CONGESTION_THRESHOLDS
 
+if TYPE_CHECKING:
+    import geopandas as gpd  # 型注釈のみで使用（実行時のimportを省く）
+
+# numbaのインポート（未インストール時はNumPy実装にフォールバック）
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    njit = None
+
+# 速度ビンの並び順（遅い順）に対応する混雑度レベル
+CONGESTION_LEVEL_ORDER = ('high', 'medium', 'low', 'unknown')
+
+# 日本語カテゴリ
+CONGESTION_LABELS = {
+    'low': '空いている',
+    'medium': 'やや混雑',
+    'high': '混雑',
+    'unknown': 'データなし'
+}
+
+# 混雑度コード（CONGESTION_LEVEL_ORDERのインデックス）→ RGBA（uint8）のルックアップテーブル
+CONGESTION_RGBA = np.array(
+    [list(bytes.fromhex(CONGESTION_COLORS[level].lstrip('#'))) + [255] for level in CONGESTION_LEVEL_ORDER],
+    dtype=np.uint8
+)
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _classify_speeds(speeds, high_speed, medium_speed, out_codes):
+        """速度配列を1パスで混雑度コード（CONGESTION_LEVEL_ORDERのインデックス）に分類"""
+        for i in range(speeds.size):
+            s = speeds[i]
+            if np.isnan(s):
+                out_codes[i] = 3
+            elif s >= high_speed:
+                out_codes[i] = 2
+            elif s >= medium_speed:
+                out_codes[i] = 1
+            else:
+                out_codes[i] = 0
+    
+    # インポート時にJITコンパイルを済ませておく
+    _classify_speeds(np.array([np.nan, 10, 25, 40], dtype=np.float32),
+                     np.float32(30), np.float32(20), np.empty(4, dtype=np.int8))
+
 class CongestionAnalyzer:
     """混雑度分析・計算クラス"""
     
@@ -14,6 +61,49 @@ class CongestionAnalyzer:
         self.colors = CONGESTION_COLORS
         self.logger = logging.getLogger(__name__)
     
+    def _numeric_array(self, gdf: gpd.GeoDataFrame, column: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        数値列をfloat32配列に変換
+        
+        Args:
+            gdf: 対象データ
+            column: 列名
+            
+        Returns:
+            Tuple: (float32配列, 有効値マスク)
+        """
+        arr = pd.to_numeric(gdf[column], errors='coerce').to_numpy(dtype=np.float32)
+        return arr, ~np.isnan(arr)
+    
+    def _speed_array(self, gdf: gpd.GeoDataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """平均速度列をfloat32配列に変換"""
+        return self._numeric_array(gdf, '平均速度')
+    
+    def _classify(self, speeds: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """
+        速度配列を混雑度コードに分類
+        
+        Args:
+            speeds: float32速度配列
+            valid: 有効値マスク
+            
+        Returns:
+            np.ndarray: CONGESTION_LEVEL_ORDERのインデックス（int8）
+        """
+        high_speed = np.float32(self.speed_thresholds['high_speed'])
+        medium_speed = np.float32(self.speed_thresholds['medium_speed'])
+        
+        if NUMBA_AVAILABLE:
+            codes = np.empty(speeds.size, dtype=np.int8)
+            _classify_speeds(speeds, high_speed, medium_speed, codes)
+            return codes
+        
+        # しきい値ビンへの二分探索
+        bins = np.array([medium_speed, high_speed], dtype=np.float32)
+        codes = np.searchsorted(bins, speeds, side='right').astype(np.int8)
+        codes[~valid] = 3
+        return codes
+    
     def calculate_congestion_level(self, gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         """
         混雑度レベル計算
@@ -27,52 +117,42 @@ class CongestionAnalyzer:
         if gdf.empty:
             return gdf
         
-        result = gdf.copy()
+        # 入力は変更せず、assignで列を追加したフレームを返す（ジオメトリ列は複製しない）
         
         # 平均速度列の確認
-        if '平均速度' not in result.columns:
+        if '平均速度' not in gdf.columns:
             self.logger.warning("No speed data found, marking all as unknown")
-            result['congestion_level'] = 'unknown'
-            result['congestion_color'] = self.colors['unknown']
-            result['speed_category'] = 'データなし'
-            return result
-        
-        # 速度データの前処理
-        speeds = result['平均速度'].copy()
-        
-        # 数値変換
-        speeds = pd.to_numeric(speeds, errors='coerce')
-        
-        # 混雑度レベル分類
-        conditions = [
-            speeds >= self.speed_thresholds['high_speed'],    # 30km/h以上
-            speeds >= self.speed_thresholds['medium_speed'],  # 20-30km/h
-            speeds < self.speed_thresholds['medium_speed']    # 20km/h未満
-        ]
-        choices = ['low', 'medium', 'high']
-        
-        # 条件適用
-        result['congestion_level'] = np.select(
-            conditions, 
-            choices, 
-            default='unknown'  # NaNやその他の値
+            return gdf.assign(
+                congestion_level=pd.Categorical.from_codes(
+                    np.full(len(gdf), CONGESTION_LEVEL_ORDER.index('unknown')),
+                    categories=CONGESTION_LEVEL_ORDER
+                ),
+                congestion_color=self.colors['unknown'],
+                speed_category='データなし'
+            )
+        
+        # 速度データの前処理（数値変換・float32化を1回で実施）
+        speeds, valid = self._speed_array(gdf)
+        
+        # 混雑度レベル分類（1パス）
+        # 0: 20km/h未満, 1: 20-30km/h, 2: 30km/h以上, 3: NaN
+        idx = self._classify(speeds, valid)
+        
+        # レベルはインデックスをそのままコードとするCategorical、色・日本語カテゴリは同じインデックスで参照
+        colors = np.array([self.colors[level] for level in CONGESTION_LEVEL_ORDER], dtype=object)
+        labels = np.array([CONGESTION_LABELS[level] for level in CONGESTION_LEVEL_ORDER], dtype=object)
+        
+        result = gdf.assign(
+            congestion_level=pd.Categorical.from_codes(idx, categories=CONGESTION_LEVEL_ORDER),
+            congestion_color=colors[idx],
+            speed_category=labels[idx]
         )
         
-        # 色マッピング
-        result['congestion_color'] = result['congestion_level'].map(self.colors)
-        
-        # 日本語カテゴリ
-        congestion_labels = {
-            'low': '空いている',
-            'medium': 'やや混雑',
-            'high': '混雑',
-            'unknown': 'データなし'
-        }
-        result['speed_category'] = result['congestion_level'].map(congestion_labels)
-        
-        # 統計ログ
-        level_counts = result['congestion_level'].value_counts()
-        self.logger.info(f"Congestion analysis completed: {dict(level_counts)}")
+        # 統計ログ（INFO無効時は集計自体を省略）
+        if self.logger.isEnabledFor(logging.INFO):
+            counts = np.bincount(idx, minlength=len(CONGESTION_LEVEL_ORDER))
+            level_counts = {level: int(c) for level, c in zip(CONGESTION_LEVEL_ORDER, counts) if c > 0}
+            self.logger.info("Congestion analysis completed: %s", level_counts)
         
         return result
     
@@ -95,61 +175,100 @@ class CongestionAnalyzer:
                 'analysis_timestamp': pd.Timestamp.now().isoformat()
             }
         
+        stats = self.generate_base_statistics(gdf)
+        stats.update(self.generate_level_statistics(gdf))
+        return stats
+    
+    def generate_level_statistics(self, gdf: gpd.GeoDataFrame) -> Dict[str, Any]:
+        """
+        混雑度レベル別の件数・割合（しきい値に依存する統計）
+        
+        Args:
+            gdf: 混雑度レベル付きデータ
+            
+        Returns:
+            Dict: congestion_distribution, congestion_percentage
+        """
         total_roads = len(gdf)
         
         # 混雑度レベル別集計
-        if 'congestion_level' in gdf.columns:
-            level_counts = gdf['congestion_level'].value_counts()
+        if 'congestion_level' in gdf.columns and total_roads > 0:
+            levels = gdf['congestion_level']
+            if isinstance(levels.dtype, pd.CategoricalDtype):
+                # Categoricalのコードを1パスで集計
+                codes = levels.cat.codes.to_numpy()
+                counts = np.bincount(codes[codes >= 0], minlength=len(levels.cat.categories))
+                level_counts = pd.Series(counts, index=levels.cat.categories)
+                level_counts = level_counts[level_counts > 0].sort_values(ascending=False, kind='stable')
+            else:
+                level_counts = levels.value_counts()
             level_percentages = (level_counts / total_roads * 100).round(1)
         else:
             level_counts = pd.Series(dtype=int)
             level_percentages = pd.Series(dtype=float)
         
+        return {
+            'congestion_distribution': {level: int(c) for level, c in level_counts.items()},
+            'congestion_percentage': {level: float(p) for level, p in level_percentages.items()}
+        }
+    
+    def generate_base_statistics(self, gdf: gpd.GeoDataFrame) -> Dict[str, Any]:
+        """
+        しきい値に依存しない統計情報生成（道路数・速度・旅行時間・観測点数）
+        
+        Args:
+            gdf: 道路データ（平均速度含む）
+            
+        Returns:
+            Dict: 統計情報
+        """
         stats = {
-            'total_roads': total_roads,
-            'congestion_distribution': level_counts.to_dict(),
-            'congestion_percentage': level_percentages.to_dict(),
+            'total_roads': len(gdf),
             'analysis_timestamp': pd.Timestamp.now().isoformat()
         }
         
         # 速度統計
         if '平均速度' in gdf.columns:
-            speed_data = pd.to_numeric(gdf['平均速度'], errors='coerce').dropna()
-            if not speed_data.empty:
+            speeds, valid = self._speed_array(gdf)
+            speed_data = speeds[valid]
+            if speed_data.size > 0:
+                q25, median, q75 = np.quantile(speed_data, [0.25, 0.5, 0.75])
                 stats['speed_stats'] = {
-                    'count': int(len(speed_data)),
-                    'mean': float(speed_data.mean()),
-                    'median': float(speed_data.median()),
+                    'count': int(speed_data.size),
+                    'mean': float(speed_data.mean(dtype=np.float64)),
+                    'median': float(median),
                     'min': float(speed_data.min()),
                     'max': float(speed_data.max()),
-                    'std': float(speed_data.std()),
-                    'q25': float(speed_data.quantile(0.25)),
-                    'q75': float(speed_data.quantile(0.75))
+                    'std': float(speed_data.std(dtype=np.float64, ddof=1)) if speed_data.size > 1 else float('nan'),
+                    'q25': float(q25),
+                    'q75': float(q75)
                 }
             else:
                 stats['speed_stats'] = {'count': 0}
         
         # 旅行時間統計
         if '旅行時間' in gdf.columns:
-            travel_time_data = pd.to_numeric(gdf['旅行時間'], errors='coerce').dropna()
-            if not travel_time_data.empty:
+            travel_times, valid = self._numeric_array(gdf, '旅行時間')
+            travel_time_data = travel_times[valid]
+            if travel_time_data.size > 0:
                 stats['travel_time_stats'] = {
-                    'count': int(len(travel_time_data)),
-                    'mean': float(travel_time_data.mean()),
-                    'median': float(travel_time_data.median()),
+                    'count': int(travel_time_data.size),
+                    'mean': float(travel_time_data.mean(dtype=np.float64)),
+                    'median': float(np.median(travel_time_data)),
                     'min': float(travel_time_data.min()),
                     'max': float(travel_time_data.max())
                 }
         
         # 観測点数統計
         if 'observation_count' in gdf.columns:
-            obs_data = pd.to_numeric(gdf['observation_count'], errors='coerce').dropna()
-            if not obs_data.empty:
+            obs_counts, valid = self._numeric_array(gdf, 'observation_count')
+            obs_data = obs_counts[valid]
+            if obs_data.size > 0:
                 stats['observation_stats'] = {
-                    'total_observations': int(obs_data.sum()),
-                    'mean_per_road': float(obs_data.mean()),
+                    'total_observations': int(obs_data.sum(dtype=np.float64)),
+                    'mean_per_road': float(obs_data.mean(dtype=np.float64)),
                     'max_per_road': int(obs_data.max()),
-                    'roads_with_data': int((obs_data > 0).sum())
+                    'roads_with_data': int(np.count_nonzero(obs_data > 0))
                 }
         
         return stats
@@ -173,20 +292,13 @@ class CongestionAnalyzer:
         
         # 道路クラス別分析
         if road_class_col in gdf.columns:
-            class_analysis = {}
-            
-            for road_class in gdf[road_class_col].dropna().unique():
-                class_data = gdf[gdf[road_class_col] == road_class]
-                if not class_data.empty:
-                    class_stats = self.generate_statistics(class_data)
-                    class_analysis[str(road_class)] = class_stats
-            
-            trends['by_road_class'] = class_analysis
+            trends['by_road_class'] = self._grouped_statistics(gdf, road_class_col)
         
         # 速度範囲別分析
         if '平均速度' in gdf.columns:
-            speed_data = pd.to_numeric(gdf['平均速度'], errors='coerce').dropna()
-            if not speed_data.empty:
+            speeds, valid = self._speed_array(gdf)
+            speed_data = speeds[valid]
+            if speed_data.size > 0:
                 # 速度範囲の定義
                 speed_ranges = [
                     (0, 10, '極低速'),
@@ -195,16 +307,17 @@ class CongestionAnalyzer:
                     (30, 50, '高速'),
                     (50, float('inf'), '極高速')
                 ]
+                bins = np.array([r[0] for r in speed_ranges] + [speed_ranges[-1][1]])
+                
+                # 1パスでビン集計
+                counts, _ = np.histogram(speed_data, bins=bins)
+                percentages = counts / speed_data.size * 100
                 
                 range_analysis = {}
-                for min_speed, max_speed, label in speed_ranges:
-                    mask = (speed_data >= min_speed) & (speed_data < max_speed)
-                    count = mask.sum()
-                    percentage = (count / len(speed_data) * 100) if len(speed_data) > 0 else 0
-                    
+                for (min_speed, max_speed, label), count, percentage in zip(speed_ranges, counts, percentages):
                     range_analysis[label] = {
                         'count': int(count),
-                        'percentage': round(percentage, 1),
+                        'percentage': round(float(percentage), 1),
                         'range': f"{min_speed}-{max_speed if max_speed != float('inf') else '∞'}km/h"
                     }
                 
@@ -212,6 +325,104 @@ class CongestionAnalyzer:
         
         return trends
     
+    def _grouped_statistics(self, gdf: gpd.GeoDataFrame, group_col: str) -> Dict[str, Dict[str, Any]]:
+        """
+        グループ別統計情報生成（generate_statisticsと同じ形式をgroupby一括集計で作成）
+        
+        Args:
+            gdf: 混雑度レベル付きデータ
+            group_col: グループ化する列名
+            
+        Returns:
+            Dict: グループ値ごとの統計情報
+        """
+        keys = gdf[group_col]
+        sizes = keys.groupby(keys, sort=False, observed=True).size()
+        if sizes.empty:
+            return {}
+        
+        timestamp = pd.Timestamp.now().isoformat()
+        
+        # 混雑度レベル別集計（レベルが全て欠損のグループは空の分布）
+        level_counts = gdf.groupby([keys, gdf['congestion_level']], sort=False, observed=True).size()
+        no_levels = pd.Series(dtype='int64')
+        
+        # 速度統計
+        speed_agg = pd.DataFrame()
+        if '平均速度' in gdf.columns:
+            speeds = pd.Series(self._speed_array(gdf)[0], index=gdf.index)
+            speed_grp = speeds.groupby(keys, sort=False, observed=True)
+            speed_agg = speed_grp.agg(['count', 'mean', 'median', 'min', 'max', 'std'])
+            speed_agg = speed_agg.join(speed_grp.quantile([0.25, 0.75]).unstack())
+        
+        # 旅行時間統計
+        travel_time_agg = pd.DataFrame()
+        if '旅行時間' in gdf.columns:
+            travel_times = pd.Series(self._numeric_array(gdf, '旅行時間')[0], index=gdf.index)
+            travel_time_agg = travel_times.groupby(keys, sort=False, observed=True).agg(
+                ['count', 'mean', 'median', 'min', 'max']
+            )
+        
+        # 観測点数統計
+        obs_agg = pd.DataFrame()
+        if 'observation_count' in gdf.columns:
+            obs_counts = pd.Series(self._numeric_array(gdf, 'observation_count')[0], index=gdf.index)
+            obs_agg = obs_counts.groupby(keys, sort=False, observed=True).agg(['count', 'sum', 'mean', 'max'])
+            obs_agg['with_data'] = (obs_counts > 0).groupby(keys, sort=False, observed=True).sum()
+        
+        group_stats = {}
+        for key, total in sizes.items():
+            counts = level_counts.get(key, no_levels).sort_values(ascending=False)
+            stats = {
+                'total_roads': int(total),
+                'congestion_distribution': {level: int(c) for level, c in counts.items()},
+                'congestion_percentage': {
+                    level: round(c / total * 100, 1) for level, c in counts.items()
+                },
+                'analysis_timestamp': timestamp
+            }
+            
+            if not speed_agg.empty:
+                row = speed_agg.loc[key]
+                if row['count'] > 0:
+                    stats['speed_stats'] = {
+                        'count': int(row['count']),
+                        'mean': float(row['mean']),
+                        'median': float(row['median']),
+                        'min': float(row['min']),
+                        'max': float(row['max']),
+                        'std': float(row['std']),
+                        'q25': float(row[0.25]),
+                        'q75': float(row[0.75])
+                    }
+                else:
+                    stats['speed_stats'] = {'count': 0}
+            
+            if not travel_time_agg.empty:
+                row = travel_time_agg.loc[key]
+                if row['count'] > 0:
+                    stats['travel_time_stats'] = {
+                        'count': int(row['count']),
+                        'mean': float(row['mean']),
+                        'median': float(row['median']),
+                        'min': float(row['min']),
+                        'max': float(row['max'])
+                    }
+            
+            if not obs_agg.empty:
+                row = obs_agg.loc[key]
+                if row['count'] > 0:
+                    stats['observation_stats'] = {
+                        'total_observations': int(row['sum']),
+                        'mean_per_road': float(row['mean']),
+                        'max_per_road': int(row['max']),
+                        'roads_with_data': int(row['with_data'])
+                    }
+            
+            group_stats[str(key)] = stats
+        
+        return group_stats
+    
     def get_congestion_summary(self, gdf: gpd.GeoDataFrame) -> str:
         """
         混雑度サマリーテキスト生成
@@ -289,7 +500,7 @@ def test_congestion_analyzer():
     if traffic_data is not None and not road_data.empty:
         # 空間結合・集約
         joined_data = spatial_processor.join_traffic_roads(traffic_data, road_data)
-        aggregated_data = spatial_processor.aggregate_by_road(joined_data)
+        aggregated_data = spatial_processor.aggregate_by_road(joined_data, road_data)
         
         if not aggregated_data.empty:
             # 混雑度分析テスト
@@ -7,10 +7,16 @@ if TYPE_CHECKING:
     import folium
 import json
 import logging
+from functools import partial
+import numpy as np
+import shapely
+from shapely.geometry import box
 from config import (
-    TMDU_CENTER, MAP_ZOOM_LEVEL, MAP_TILES, 
-    ROAD_LINE_WIDTH, ROAD_LINE_OPACITY, CONGESTION_COLORS
+    TMDU_CENTER, MAP_ZOOM_LEVEL, MAP_TILES, BBOX_5KM,
+    ROAD_LINE_WIDTH, ROAD_LINE_OPACITY, ROAD_MIN_DISPLAY_PIXELS, ROAD_SIMPLIFY_TOLERANCE,
+    CONGESTION_COLORS
 )
+from congestion_analyzer import CONGESTION_LEVEL_ORDER, CONGESTION_RGBA
 
 # foliumのインポート（エラーハンドリング付き）
 try:
@@ -20,179 +26,24 @@ except ImportError:
     FOLIUM_AVAILABLE = False
     folium = None
 
-class MapVisualizer:
-    """地図可視化クラス"""
-    
-    def __init__(self, center: Tuple[float, float] = TMDU_CENTER, zoom: int = MAP_ZOOM_LEVEL):
-        self.center = center
-        self.zoom = zoom
-        self.logger = logging.getLogger(__name__)
-    
-    def create_traffic_map(self, road_data: gpd.GeoDataFrame, 
-                          stats: Optional[Dict[str, Any]] = None) -> Optional[object]:
-        """
-        交通状況地図作成
-        
-        Args:
-            road_data: 混雑度付き道路データ
-            stats: 統計情報（オプション）
-            
-        Returns:
-            folium.Map: 作成された地図（folium利用可能時）
-        """
-        if not FOLIUM_AVAILABLE:
-            self.logger.error("Folium is not available - cannot create map")
-            return None
-            
-        try:
-            # ベースマップ作成
-            m = self._create_base_map()
-            
-            # 道路レイヤー追加
-            if not road_data.empty:
-                self._add_road_layer(m, road_data)
-                self.logger.info(f"Added {len(road_data)} road segments to map")
-            else:
-                self.logger.warning("No road data to display")
-            
-            # 統計情報パネル追加
-            if stats:
-                self._add_statistics_panel(m, stats)
-            
-            # 凡例追加
-            self._add_legend(m)
-            
-            # 大学位置マーカー追加
-            self._add_university_marker(m)
-            
-            return m
-            
-        except Exception as e:
-            self.logger.error(f"Map creation failed: {e}")
-            # フォールバック: 基本マップのみ
-            return self._create_base_map()
-    
-    def _create_base_map(self) -> Optional[object]:
-        """ベースマップ作成"""
-        if not FOLIUM_AVAILABLE:
-            return None
-            
-        m = folium.Map(
-            location=self.center,
-            zoom_start=self.zoom,
-            tiles=MAP_TILES
-        )
-        
-        # タイル層の追加オプション
-        folium.TileLayer(
-            tiles='CartoDB positron',
-            name='CartoDB Positron',
-            attr='CartoDB'
-        ).add_to(m)
-        
-        # レイヤーコントロール追加
-        folium.LayerControl().add_to(m)
-        
-        return m
-    
-    def _add_road_layer(self, m: object, road_data: gpd.GeoDataFrame):
-        """道路レイヤー追加"""
-        for idx, row in road_data.iterrows():
-            try:
-                if pd.isna(row.geometry):
-                    continue
-                
-                # 色とスタイル設定
-                color = row.get('congestion_color', CONGESTION_COLORS['unknown'])
-                
-                # 線の太さを混雑度に応じて調整
-                weight = self._get_line_weight(row.get('congestion_level', 'unknown'))
-                
-                # ポップアップ情報作成
-                popup_html = self._create_popup_html(row)
-                
-                # ツールチップ作成
-                tooltip_text = self._create_tooltip_text(row)
-                
-                # シンプルなPolyLineを使用（lambda関数を避ける）
-                if hasattr(row.geometry, 'coords'):
-                    coords = list(row.geometry.coords)
-                    # 座標を緯度経度順に変換（Foliumは[lat, lon]順）
-                    locations = [(lat, lon) for lon, lat in coords]
-                    
-                    folium.PolyLine(
-                        locations=locations,
-                        color=color,
-                        weight=weight,
-                        opacity=1.0,  # 完全不透明にして見やすく
-                        popup=folium.Popup(popup_html, max_width=350),
-                        tooltip=tooltip_text
-                    ).add_to(m)
-                else:
-                    # MultiLineString などの場合
-                    try:
-                        import shapely.ops
-                        if row.geometry.geom_type == 'MultiLineString':
-                            for line in row.geometry.geoms:
-                                coords = list(line.coords)
-                                locations = [(lat, lon) for lon, lat in coords]
-                                folium.PolyLine(
-                                    locations=locations,
-                                    color=color,
-                                    weight=weight,
-                                    opacity=1.0,  # 完全不透明にして見やすく
-                                    popup=folium.Popup(popup_html, max_width=350),
-                                    tooltip=tooltip_text
-                                ).add_to(m)
-                    except Exception as geom_error:
-                        self.logger.warning(f"Failed to process geometry: {geom_error}")
-                
-            except Exception as e:
-                self.logger.warning(f"Failed to add road segment {idx}: {e}")
-                continue
-    
-    def _get_line_weight(self, congestion_level: str) -> int:
-        """混雑度に応じた線の太さ決定"""
-        weight_map = {
-            'high': 8,     # 混雑: 太い
-            'medium': 6,   # やや混雑: やや太い
-            'low': 4,      # 空いている: 標準
-            'unknown': 2   # データなし: 細い
-        }
-        return weight_map.get(congestion_level, 4)
-    
-    def _create_popup_html(self, row: pd.Series) -> str:
-        """ポップアップHTML作成"""
-        road_name = row.get('road_name', 'N/A')
-        road_id = row.get('road_id', 'N/A')
-        speed = row.get('平均速度', 'N/A')
-        travel_time = row.get('旅行時間', 'N/A')
-        congestion_level = row.get('congestion_level', 'unknown')
-        speed_category = row.get('speed_category', 'データなし')
-        observation_count = row.get('observation_count', 'N/A')
-        
-        # 数値の整形
-        if pd.notna(speed) and speed != 'N/A':
-            try:
-                speed = f"{float(speed):.1f}"
-            except (ValueError, TypeError):
-                speed = 'N/A'
-        
-        if pd.notna(travel_time) and travel_time != 'N/A':
-            try:
-                travel_time = f"{float(travel_time):.0f}"
-            except (ValueError, TypeError):
-                travel_time = 'N/A'
-        
-        # 混雑度に応じた背景色
-        bg_color = {
-            'high': '#ffe6e6',      # 薄い赤
-            'medium': '#fff9e6',    # 薄い黄
-            'low': '#e6ffe6',       # 薄い緑
-            'unknown': '#f0f0f0'    # 薄い灰色
-        }.get(congestion_level, '#f0f0f0')
-        
-        html = f"""
+# 混雑度に応じた線の太さ
+ROAD_LINE_WEIGHTS = {
+    'high': 8,     # 混雑: 太い
+    'medium': 6,   # やや混雑: やや太い
+    'low': 4,      # 空いている: 標準
+    'unknown': 2   # データなし: 細い
+}
+
+# 混雑度に応じたポップアップ背景色
+POPUP_BG_COLORS = {
+    'high': '#ffe6e6',      # 薄い赤
+    'medium': '#fff9e6',    # 薄い黄
+    'low': '#e6ffe6',       # 薄い緑
+    'unknown': '#f0f0f0'    # 薄い灰色
+}
+
+# 道路ポップアップのHTMLテンプレート（速度・旅行時間は整形済み文字列を埋め込む）
+_POPUP_TEMPLATE = """
         <div style="font-family: 'Noto Sans JP', Arial, sans-serif; 
                     background-color: {bg_color}; 
                     padding: 10px; 
@@ -205,7 +56,7 @@ class MapVisualizer:
             
             <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 8px; font-size: 13px;">
                 <div><strong>混雑状況:</strong></div>
-                <div style="color: {row.get('congestion_color', '#666')}; font-weight: bold;">
+                <div style="color: {congestion_color}; font-weight: bold;">
                     {speed_category}
                 </div>
                 
@@ -223,41 +74,9 @@ class MapVisualizer:
             </div>
         </div>
         """
-        return html
-    
-    def _create_tooltip_text(self, row: pd.Series) -> str:
-        """ツールチップテキスト作成"""
-        road_name = row.get('road_name', '道路名不明')
-        speed_category = row.get('speed_category', 'データなし')
-        speed = row.get('平均速度', 'N/A')
-        
-        if pd.notna(speed) and speed != 'N/A':
-            try:
-                speed_text = f" ({float(speed):.1f}km/h)"
-            except (ValueError, TypeError):
-                speed_text = ""
-        else:
-            speed_text = ""
-        
-        return f"{road_name}: {speed_category}{speed_text}"
-    
-    def _add_statistics_panel(self, m: object, stats: Dict[str, Any]):
-        """統計情報パネル追加"""
-        if 'congestion_percentage' not in stats:
-            return
-        
-        percentages = stats['congestion_percentage']
-        total_roads = stats.get('total_roads', 0)
-        
-        # 速度統計
-        speed_stats = stats.get('speed_stats', {})
-        avg_speed = speed_stats.get('mean', 0)
-        
-        # 観測統計
-        obs_stats = stats.get('observation_stats', {})
-        total_observations = obs_stats.get('total_observations', 0)
-        
-        html = f"""
+
+# 統計情報パネルのHTMLテンプレート（色は読込時に埋め込み、件数・割合・時刻のみ描画時に埋める）
+_STATS_PANEL_TEMPLATE = f"""
         <div style="position: fixed; 
                     top: 10px; right: 10px; 
                     width: 280px; height: auto; 
@@ -274,41 +93,39 @@ class MapVisualizer:
             </h4>
             
             <div style="margin-bottom: 10px;">
-                <strong>対象道路数:</strong> {total_roads} 路線<br>
-                <strong>観測点数:</strong> {total_observations} 地点
+                <strong>対象道路数:</strong> {{total_roads}} 路線<br>
+                <strong>観測点数:</strong> {{total_observations}} 地点
             </div>
             
             <div style="margin-bottom: 15px;">
                 <div style="display: flex; align-items: center; margin-bottom: 5px;">
                     <span style="color: {CONGESTION_COLORS['low']}; font-size: 18px; margin-right: 8px;">●</span>
-                    <span>空いている: <strong>{percentages.get('low', 0):.1f}%</strong></span>
+                    <span>空いている: <strong>{{low_pct:.1f}}%</strong></span>
                 </div>
                 <div style="display: flex; align-items: center; margin-bottom: 5px;">
                     <span style="color: {CONGESTION_COLORS['medium']}; font-size: 18px; margin-right: 8px;">●</span>
-                    <span>やや混雑: <strong>{percentages.get('medium', 0):.1f}%</strong></span>
+                    <span>やや混雑: <strong>{{medium_pct:.1f}}%</strong></span>
                 </div>
                 <div style="display: flex; align-items: center; margin-bottom: 5px;">
                     <span style="color: {CONGESTION_COLORS['high']}; font-size: 18px; margin-right: 8px;">●</span>
-                    <span>混雑: <strong>{percentages.get('high', 0):.1f}%</strong></span>
+                    <span>混雑: <strong>{{high_pct:.1f}}%</strong></span>
                 </div>
                 <div style="display: flex; align-items: center;">
                     <span style="color: {CONGESTION_COLORS['unknown']}; font-size: 18px; margin-right: 8px;">●</span>
-                    <span>データなし: <strong>{percentages.get('unknown', 0):.1f}%</strong></span>
+                    <span>データなし: <strong>{{unknown_pct:.1f}}%</strong></span>
                 </div>
             </div>
             
-            {f'<div><strong>平均速度:</strong> {avg_speed:.1f} km/h</div>' if avg_speed > 0 else ''}
+            {{avg_speed_html}}
             
             <div style="margin-top: 10px; font-size: 11px; color: #666; border-top: 1px solid #ddd; padding-top: 8px;">
-                最終更新: {pd.Timestamp.now().strftime('%H:%M:%S')}
+                最終更新: {{updated_at}}
             </div>
         </div>
         """
-        m.get_root().html.add_child(folium.Element(html))
-    
-    def _add_legend(self, m: object):
-        """凡例追加"""
-        legend_html = f"""
+
+# 凡例のHTML（すべて静的なため読込時に1回だけ生成）
+_LEGEND_HTML = f"""
         <div style="position: fixed; 
                     bottom: 30px; left: 30px; 
                     width: 200px; height: auto; 
@@ -341,7 +158,239 @@ class MapVisualizer:
             </div>
         </div>
         """
-        m.get_root().html.add_child(folium.Element(legend_html))
+
+def _road_style(styles: Tuple[Dict[str, Any], ...], feature: Dict[str, Any]) -> Dict[str, Any]:
+    """道路レイヤーのスタイル（フィーチャーの混雑度コードでスタイル表を引く）"""
+    return styles[feature['properties']['code']]
+
+class MapVisualizer:
+    """地図可視化クラス"""
+    
+    def __init__(self, center: Tuple[float, float] = TMDU_CENTER, zoom: int = MAP_ZOOM_LEVEL,
+                 bbox: Optional[Tuple[float, float, float, float]] = BBOX_5KM,
+                 simplify_tolerance: Optional[float] = ROAD_SIMPLIFY_TOLERANCE):
+        self.center = center
+        self.zoom = zoom
+        self.bbox = bbox  # 表示範囲 (minLon, minLat, maxLon, maxLat)
+        self.simplify_tolerance = simplify_tolerance  # 描画前の簡略化許容誤差（度、Noneで簡略化しない）
+        self.logger = logging.getLogger(__name__)
+    
+    def create_traffic_map(self, road_data: gpd.GeoDataFrame, 
+                          stats: Optional[Dict[str, Any]] = None) -> Optional[object]:
+        """
+        交通状況地図作成
+        
+        Args:
+            road_data: 混雑度付き道路データ
+            stats: 統計情報（オプション）
+            
+        Returns:
+            folium.Map: 作成された地図（folium利用可能時）
+        """
+        if not FOLIUM_AVAILABLE:
+            self.logger.error("Folium is not available - cannot create map")
+            return None
+            
+        try:
+            # ベースマップ作成
+            m = self._create_base_map()
+            
+            # 道路レイヤー追加（表示範囲外・サブピクセルの道路は送らない）
+            road_data = self._simplify_roads(self._cull_roads(road_data))
+            if not road_data.empty:
+                self._add_road_layer(m, road_data)
+                self.logger.info(f"Added {len(road_data)} road segments to map")
+            else:
+                self.logger.warning("No road data to display")
+            
+            # 統計情報パネル追加
+            if stats:
+                self._add_statistics_panel(m, stats)
+            
+            # 凡例追加
+            self._add_legend(m)
+            
+            # 大学位置マーカー追加
+            self._add_university_marker(m)
+            
+            return m
+            
+        except Exception as e:
+            self.logger.error(f"Map creation failed: {e}")
+            # フォールバック: 基本マップのみ
+            return self._create_base_map()
+    
+    def _create_base_map(self) -> Optional[object]:
+        """ベースマップ作成"""
+        if not FOLIUM_AVAILABLE:
+            return None
+            
+        m = folium.Map(
+            location=self.center,
+            zoom_start=self.zoom,
+            tiles=MAP_TILES,
+            prefer_canvas=True  # SVGではなくCanvasで描画（道路数が多い場合のDOM負荷軽減）
+        )
+        
+        # タイル層の追加オプション
+        folium.TileLayer(
+            tiles='CartoDB positron',
+            name='CartoDB Positron',
+            attr='CartoDB'
+        ).add_to(m)
+        
+        # レイヤーコントロール追加
+        folium.LayerControl().add_to(m)
+        
+        return m
+    
+    def _cull_roads(self, road_data: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """表示範囲外の道路・初期ズームで1ピクセル未満の道路を除外"""
+        if road_data.empty or 'geometry' not in road_data.columns:
+            return road_data
+        
+        before_count = len(road_data)
+        
+        # BBOXでクリップ（範囲外にはみ出した部分を除去）
+        if self.bbox is not None:
+            road_data = gpd.clip(road_data, box(*self.bbox))
+        
+        # Web Mercatorのズームレベルにおける1度あたりのピクセル数（経度方向）
+        pixels_per_degree = 256 * 2 ** self.zoom / 360
+        min_length = ROAD_MIN_DISPLAY_PIXELS / pixels_per_degree
+        road_data = road_data[shapely.length(np.asarray(road_data.geometry.values)) >= min_length]
+        
+        if len(road_data) < before_count:
+            self.logger.info(f"Culled roads for display: {before_count} -> {len(road_data)}")
+        
+        return road_data
+    
+    def _simplify_roads(self, road_data: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """描画前にDouglas-Peucker法で道路形状を簡略化（GeoSeries.simplifyでshapelyに一括委譲）"""
+        if self.simplify_tolerance is None or road_data.empty or 'geometry' not in road_data.columns:
+            return road_data
+        return road_data.assign(
+            geometry=road_data.geometry.simplify(self.simplify_tolerance, preserve_topology=False)
+        )
+    
+    def _add_road_layer(self, m: object, road_data: gpd.GeoDataFrame):
+        """道路レイヤー追加（全道路を1つのGeoJson FeatureCollectionとして一括描画）"""
+        geoms = road_data.geometry.values
+        road_data = road_data[~(shapely.is_missing(geoms) | shapely.is_empty(geoms))]
+        if road_data.empty:
+            return
+        
+        # フィーチャーには混雑度コードのみ持たせ、色・太さはコード別の4件のスタイル表から引く
+        if 'congestion_level' in road_data.columns:
+            codes = pd.Categorical(road_data['congestion_level'], categories=CONGESTION_LEVEL_ORDER).codes
+            codes = np.where(codes < 0, len(CONGESTION_LEVEL_ORDER) - 1, codes)
+        else:
+            codes = np.full(len(road_data), len(CONGESTION_LEVEL_ORDER) - 1)
+        styles = tuple(
+            {
+                'color': '#%02x%02x%02x' % tuple(rgba[:3]),
+                'weight': ROAD_LINE_WEIGHTS[level],
+                'opacity': rgba[3] / 255  # 完全不透明にして見やすく
+            }
+            for level, rgba in zip(CONGESTION_LEVEL_ORDER, CONGESTION_RGBA.tolist())
+        )
+        
+        # ポップアップ・ツールチップのHTML生成（列をNumPy配列で一度だけ取り出し、行Seriesを作らない）
+        bg_colors = np.array([POPUP_BG_COLORS[level] for level in CONGESTION_LEVEL_ORDER], dtype=object)[codes]
+        road_names = self._column_values(road_data, 'road_name', 'N/A')
+        speeds = self._format_numeric(road_data, '平均速度', '{:.1f}', 'N/A')
+        speed_categories = self._column_values(road_data, 'speed_category', 'データなし')
+        popups = [
+            self._create_popup_html(*values)
+            for values in zip(
+                road_names,
+                self._column_values(road_data, 'road_id', 'N/A'),
+                speeds,
+                self._format_numeric(road_data, '旅行時間', '{:.0f}', 'N/A'),
+                bg_colors,
+                speed_categories,
+                self._column_values(road_data, 'observation_count', 'N/A'),
+                self._column_values(road_data, 'congestion_color', '#666')
+            )
+        ]
+        tooltip_names = road_names if 'road_name' in road_data.columns else self._column_values(road_data, 'road_name', '道路名不明')
+        speed_texts = self._format_numeric(road_data, '平均速度', ' ({:.1f}km/h)', '')
+        tooltips = [self._create_tooltip_text(*values) for values in zip(tooltip_names, speed_categories, speed_texts)]
+        
+        layer_data = gpd.GeoDataFrame({
+            'code': codes,
+            'popup_html': popups,
+            'tooltip': tooltips,
+        }, geometry=road_data.geometry, index=road_data.index)
+        
+        # GeoJSONは[lon, lat]順のため座標変換不要。dictで渡してfolium側のJSON往復・to_crsを避ける
+        # style_functionはキャッシュ時のpickleに対応するためモジュール関数のpartialを使用（lambdaは不可）
+        folium.GeoJson(
+            layer_data.to_geo_dict(drop_id=True),
+            name='道路混雑度',
+            style_function=partial(_road_style, styles),
+            popup=folium.GeoJsonPopup(
+                fields=['popup_html'], labels=False, localize=False, max_width=350
+            ),
+            tooltip=folium.GeoJsonTooltip(
+                fields=['tooltip'], labels=False, localize=False
+            )
+        ).add_to(m)
+    
+    @staticmethod
+    def _column_values(road_data: gpd.GeoDataFrame, column: str, default: Any) -> np.ndarray:
+        """列の値をNumPy配列で取得（列がない場合は既定値で埋める）"""
+        if column in road_data.columns:
+            return road_data[column].to_numpy()
+        return np.full(len(road_data), default, dtype=object)
+    
+    @staticmethod
+    def _format_numeric(road_data: gpd.GeoDataFrame, column: str, fmt: str, default: str) -> np.ndarray:
+        """数値列をまとめて文字列に整形（数値化できない値・欠損は既定値）"""
+        if column not in road_data.columns:
+            return np.full(len(road_data), default, dtype=object)
+        values = pd.to_numeric(road_data[column], errors='coerce')
+        return np.where(values.notna(), values.map(fmt.format), default)
+    
+    def _create_popup_html(self, road_name: Any, road_id: Any, speed: str, travel_time: str,
+                           bg_color: str, speed_category: str, observation_count: Any,
+                           congestion_color: str) -> str:
+        """ポップアップHTML作成（速度・旅行時間は整形済み文字列）"""
+        return _POPUP_TEMPLATE.format(
+            road_name=road_name, road_id=road_id, speed=speed, travel_time=travel_time,
+            bg_color=bg_color, speed_category=speed_category,
+            observation_count=observation_count, congestion_color=congestion_color
+        )
+    
+    def _create_tooltip_text(self, road_name: Any, speed_category: str, speed_text: str) -> str:
+        """ツールチップテキスト作成（速度は整形済みの括弧書き、なければ空文字）"""
+        return f"{road_name}: {speed_category}{speed_text}"
+    
+    def _add_statistics_panel(self, m: object, stats: Dict[str, Any]):
+        """統計情報パネル追加"""
+        if 'congestion_percentage' not in stats:
+            return
+        
+        percentages = stats['congestion_percentage']
+        
+        # 速度統計
+        avg_speed = stats.get('speed_stats', {}).get('mean', 0)
+        
+        html = _STATS_PANEL_TEMPLATE.format(
+            total_roads=stats.get('total_roads', 0),
+            total_observations=stats.get('observation_stats', {}).get('total_observations', 0),
+            low_pct=percentages.get('low', 0),
+            medium_pct=percentages.get('medium', 0),
+            high_pct=percentages.get('high', 0),
+            unknown_pct=percentages.get('unknown', 0),
+            avg_speed_html=f'<div><strong>平均速度:</strong> {avg_speed:.1f} km/h</div>' if avg_speed > 0 else '',
+            updated_at=pd.Timestamp.now().strftime('%H:%M:%S')
+        )
+        m.get_root().html.add_child(folium.Element(html))
+    
+    def _add_legend(self, m: object):
+        """凡例追加"""
+        m.get_root().html.add_child(folium.Element(_LEGEND_HTML))
     
     def _add_university_marker(self, m: object):
         """センターマーカー追加"""
@@ -397,7 +446,7 @@ def test_map_visualizer():
         if traffic_data is not None and not road_data.empty:
             # データ統合・分析
             joined_data = spatial_processor.join_traffic_roads(traffic_data, road_data)
-            aggregated_data = spatial_processor.aggregate_by_road(joined_data)
+            aggregated_data = spatial_processor.aggregate_by_road(joined_data, road_data)
             congestion_data = congestion_analyzer.calculate_congestion_level(aggregated_data)
             stats = congestion_analyzer.generate_statistics(congestion_data)
             
@@ -3,9 +3,20 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import pydeck as pdk
+import shapely
 from datetime import datetime
 import pytz
 import logging
+import json
+
+# orjsonのインポート（利用可能ならpydeckのJSON化をorjsonで実行）
+try:
+    import orjson
+    from pydeck.bindings import json_tools as pydeck_json_tools
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
 
 # 既存モジュールのインポート
 try:
@@ -13,7 +24,7 @@ try:
     from road_data import RoadDataLoader
     from spatial_processor import SpatialProcessor
     from congestion_analyzer import CongestionAnalyzer
-    from config import TMDU_CENTER, BBOX_5KM, CONGESTION_COLORS, UPDATE_INTERVAL
+    from config import TMDU_CENTER, BBOX_5KM, CONGESTION_COLORS, UPDATE_INTERVAL, ROAD_SIMPLIFY_TOLERANCE
     MODULES_AVAILABLE = True
 except ImportError as e:
     MODULES_AVAILABLE = False
@@ -30,78 +41,119 @@ st.set_page_config(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _orjson_serialize(serializable):
+    """pydeckオブジェクトをorjsonでJSON化（orjsonで扱えない値は標準jsonにフォールバック）"""
+    try:
+        return orjson.dumps(
+            serializable,
+            default=pydeck_json_tools.default_serialize,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
+    except TypeError:
+        return json.dumps(serializable, sort_keys=True, default=pydeck_json_tools.default_serialize)
+
+# Deck.to_json（st.pydeck_chartが使用）はjson_tools.serializeを呼び出し時に参照するため差し替えで有効
+if ORJSON_AVAILABLE:
+    pydeck_json_tools.serialize = _orjson_serialize
+
+# 混雑度に基づくRGBA色
+PYDECK_COLORS = {
+    'low': [0, 255, 0, 160],      # 緑（空いている）
+    'medium': [255, 255, 0, 160], # 黄（やや混雑）
+    'high': [255, 0, 0, 160],     # 赤（混雑）
+    'unknown': [128, 128, 128, 160] # 灰（不明）
+}
+
+# 混雑度による線の太さ
+PYDECK_WIDTHS = {
+    'low': 3,
+    'medium': 4,
+    'high': 5,
+    'unknown': 2
+}
+
+# 混雑度コード（PYDECK_LEVEL_ORDERのインデックス）→ 色・太さのルックアップテーブル
+PYDECK_LEVEL_ORDER = ('low', 'medium', 'high', 'unknown')
+PYDECK_RGBA = np.array([PYDECK_COLORS[level] for level in PYDECK_LEVEL_ORDER], dtype=np.uint8)
+PYDECK_WIDTH_TABLE = np.array([PYDECK_WIDTHS[level] for level in PYDECK_LEVEL_ORDER], dtype=np.uint8)
+
+@st.cache_resource(show_spinner=False)
+def get_road_loader():
+    """道路データローダー（読込済み道路・STRtreeを保持するためプロセス内で共有）"""
+    return RoadDataLoader()
+
 @st.cache_data(ttl=UPDATE_INTERVAL, show_spinner=False)
 def load_and_process_data():
-    """データ読み込みと処理（キャッシュ付き）"""
+    """データ読み込みと処理（キャッシュ付き）
+    
+    進捗はloggerにのみ出力し、結果・エラーはstatus_infoとしてmain側でまとめて表示する
+    （キャッシュ関数内のst要素はキャッシュヒット時にも再送されるため）
+    """
     if not MODULES_AVAILABLE:
-        st.error("必要なモジュールがインポートできません")
+        logger.error("Required modules could not be imported")
         return pd.DataFrame(), {"status": "error", "error": "モジュール不可"}
     
     status_info = {"status": "processing"}
     
     try:
         # データ読み込み
-        st.info("📂 道路データを読み込み中...")
-        loader = RoadDataLoader()
-        road_gdf = loader.load_road_network(bbox=BBOX_5KM)
+        road_gdf = get_road_loader().load_road_network(bbox=BBOX_5KM)
         
         if road_gdf.empty:
-            st.error("❌ 道路データファイル（N01-07L-13-01.0a_GML.zip）が見つかりません")
+            logger.error("Road data file not found")
             return pd.DataFrame(), {"status": "error", "error": "道路データなし"}
         
-        st.success(f"✅ 道路データ読み込み完了: {len(road_gdf)} 路線")
+        logger.info(f"Loaded road data: {len(road_gdf)} roads")
         
         # 交通データ取得
-        st.info("🚗 交通データを取得中...")
         fetcher = TrafficDataFetcher(use_mock=False)  # 実データを強制
         traffic_gdf = fetcher.fetch_traffic_data(bbox=BBOX_5KM)
         
         if traffic_gdf.empty:
-            st.warning("⚠️ JARTIC APIからデータを取得できませんでした。モックデータを使用します。")
+            logger.warning("JARTIC API returned no data, using mock traffic data")
             fetcher_mock = TrafficDataFetcher(use_mock=True)
             traffic_gdf = fetcher_mock.fetch_traffic_data(bbox=BBOX_5KM)
             status_info["data_source"] = "mock"
         else:
-            st.success(f"✅ 交通データ取得完了: {len(traffic_gdf)} 観測点")
+            logger.info(f"Fetched traffic data: {len(traffic_gdf)} points")
             status_info["data_source"] = "real"
         
         # 空間結合
-        st.info("🗺️ 空間データ結合中...")
         processor = SpatialProcessor(max_distance=200.0)  # 距離を200mに拡大
         joined_gdf = processor.join_traffic_roads(traffic_gdf, road_gdf)
         
         if joined_gdf.empty:
-            st.error("❌ 空間結合に失敗しました")
+            logger.error("Spatial join failed")
             return pd.DataFrame(), {"status": "error", "error": "空間結合失敗"}
         
         # マッチング統計
         matched_count = len(joined_gdf[joined_gdf['road_id'].notna()])
         match_rate = matched_count / len(joined_gdf) if len(joined_gdf) > 0 else 0
-        st.success(f"✅ 空間結合完了: {matched_count}/{len(joined_gdf)} ({match_rate:.1%}) マッチ")
+        logger.info(f"Spatial join: {matched_count}/{len(joined_gdf)} ({match_rate:.1%}) matched")
         
         # 道路別集約
-        st.info("📊 道路別データ集約中...")
         road_stats = processor.aggregate_by_road(joined_gdf, road_gdf)
         
         if road_stats.empty:
-            st.error("❌ 道路別集約に失敗しました")
+            logger.error("Aggregation by road failed")
             return pd.DataFrame(), {"status": "error", "error": "集約失敗"}
         
-        st.success(f"✅ 集約完了: {len(road_stats)} 路線にデータが集約されました")
+        logger.info(f"Aggregated into {len(road_stats)} roads")
         
         # 混雑度分析
-        st.info("🚦 混雑度分析中...")
         analyzer = CongestionAnalyzer()
         final_data = analyzer.calculate_congestion_level(road_stats)
         
         # PyDeck用データ準備
-        pydeck_data = prepare_pydeck_data(final_data)
+        pydeck_data = prepare_pydeck_data(
+            final_data, tolerance=ROAD_SIMPLIFY_TOLERANCE, bbox=BBOX_5KM, decimals=5  # 約1m精度
+        )
         
         if pydeck_data.empty:
-            st.error("❌ PyDeck用データ変換に失敗しました")
+            logger.error("PyDeck data conversion failed")
             return pd.DataFrame(), {"status": "error", "error": "データ変換失敗"}
         
-        st.success(f"✅ 処理完了: {len(pydeck_data)} 路線を地図表示用に変換")
+        logger.info(f"Prepared {len(pydeck_data)} roads for PyDeck")
         
         status_info.update({
             "status": "success",
@@ -117,112 +169,99 @@ def load_and_process_data():
         
     except Exception as e:
         logger.error(f"Data processing failed: {e}")
-        st.error(f"❌ データ処理エラー: {str(e)}")
         return pd.DataFrame(), {"status": "error", "error": str(e)}
 
-def prepare_pydeck_data(gdf):
-    """GeoDataFrameをPyDeck用データに変換"""
+def prepare_pydeck_data(gdf, tolerance=None, bbox=None, decimals=None):
+    """GeoDataFrameをPyDeck用データに変換（bbox外の道路は除外し、toleranceがNoneでなければ形状を簡略化、decimalsで座標を丸める）"""
     if gdf.empty:
         return pd.DataFrame()
     
-    # 道路の線データを点のリストに変換
-    roads_data = []
-    for idx, row in gdf.iterrows():
-        if row.geometry is None:
-            continue
-            
-        # LineStringから座標を抽出
-        if hasattr(row.geometry, 'coords'):
-            coords = list(row.geometry.coords)
-        elif hasattr(row.geometry, 'geoms'):
-            # MultiLineStringの場合
-            coords = []
-            for geom in row.geometry.geoms:
-                coords.extend(list(geom.coords))
-        else:
-            continue
-        
-        # 混雑度による色設定
-        congestion_level = getattr(row, 'congestion_level', 'unknown')
-        color = get_color_rgb(congestion_level)
-        
-        # 道路情報
-        road_info = {
-            'path': [[lon, lat] for lon, lat in coords],
-            'road_id': getattr(row, 'road_id', f'road_{idx}'),
-            'road_name': getattr(row, 'road_name', '不明'),
-            'speed': getattr(row, '平均速度', 0),
-            'congestion': congestion_level,
-            'color': color,
-            'width': get_width_by_congestion(congestion_level)
-        }
-        roads_data.append(road_info)
+    # 表示範囲 (minLon, minLat, maxLon, maxLat) と交差する道路のみ残す（.cxは空間インデックスで検索）
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        gdf = gdf.cx[min_lon:max_lon, min_lat:max_lat]
+        if gdf.empty:
+            return pd.DataFrame()
     
-    return pd.DataFrame(roads_data)
-
-def get_color_rgb(congestion_level):
-    """混雑度に基づくRGB色を取得"""
-    color_map = {
-        'low': [0, 255, 0, 160],      # 緑（空いている）
-        'medium': [255, 255, 0, 160], # 黄（やや混雑）
-        'high': [255, 0, 0, 160],     # 赤（混雑）
-        'unknown': [128, 128, 128, 160] # 灰（不明）
-    }
-    return color_map.get(congestion_level, color_map['unknown'])
-
-def get_width_by_congestion(congestion_level):
-    """混雑度による線の太さ"""
-    width_map = {
-        'low': 3,
-        'medium': 4,
-        'high': 5,
-        'unknown': 2
-    }
-    return width_map.get(congestion_level, 2)
+    # Douglas-Peucker法で頂点数を削減（GeoSeries.simplifyでshapelyに一括委譲）
+    if tolerance is not None:
+        gdf = gdf.assign(geometry=gdf.geometry.simplify(tolerance, preserve_topology=False))
+    
+    # 欠損・空のジオメトリは描画できないため除外
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    if gdf.empty:
+        return pd.DataFrame()
+    
+    # 混雑度をコード化（未知の値は'unknown'の色・太さで描画）
+    if 'congestion_level' in gdf.columns:
+        congestion = gdf['congestion_level']
+    else:
+        congestion = pd.Series('unknown', index=gdf.index)
+    codes = pd.Categorical(congestion, categories=PYDECK_LEVEL_ORDER).codes
+    codes = np.where(codes < 0, PYDECK_LEVEL_ORDER.index('unknown'), codes)
+    
+    # 全道路の頂点を1回のC呼び出しで取得し、ジオメトリ番号の境界で道路ごとに分割
+    coords, geom_index = shapely.get_coordinates(np.asarray(gdf.geometry.values), return_index=True)
+    # 座標を丸めてJSONの数値表現を短くする（pydeckはデータをJSONで送るため転送量に直結）
+    if decimals is not None:
+        coords = np.round(coords, decimals)
+    paths = np.split(coords, np.flatnonzero(np.diff(geom_index)) + 1)
+    
+    # 列単位でまとめて構築（pydeckは[lon, lat]順のため座標配列をそのままリスト化）
+    return pd.DataFrame({
+        'path': [path.tolist() for path in paths],
+        'road_id': gdf['road_id'].to_numpy() if 'road_id' in gdf.columns else ('road_' + gdf.index.astype(str)).to_numpy(),
+        'road_name': gdf['road_name'].to_numpy() if 'road_name' in gdf.columns else '不明',
+        'speed': (pd.to_numeric(gdf['平均速度'], errors='coerce').to_numpy(dtype=np.float32)
+                  if '平均速度' in gdf.columns else np.zeros(len(gdf), dtype=np.float32)),
+        'congestion': pd.Categorical.from_codes(codes, categories=PYDECK_LEVEL_ORDER),
+        'color': PYDECK_RGBA[codes].tolist(),
+        'width': PYDECK_WIDTH_TABLE[codes]
+    })
 
-def create_mock_data():
-    """モックデータ生成（PyDeck用）"""
-    np.random.seed(42)
+def create_mock_data(n_roads=30):
+    """モックデータ生成（PyDeck用、全道路分の乱数を一括生成）"""
+    rng = np.random.default_rng(42)
     center_lat, center_lon = TMDU_CENTER
     
-    roads_data = []
-    for i in range(30):
-        # ランダムな道路線を生成
-        start_lat = np.random.normal(center_lat, 0.005)
-        start_lon = np.random.normal(center_lon, 0.005)
-        end_lat = start_lat + np.random.normal(0, 0.003)
-        end_lon = start_lon + np.random.normal(0, 0.003)
-        
-        speed = np.random.normal(25, 10)
-        speed = np.clip(speed, 5, 60)
-        
-        if speed >= 30:
-            congestion = 'low'
-        elif speed >= 20:
-            congestion = 'medium'
-        else:
-            congestion = 'high'
-        
-        road_info = {
-            'path': [[start_lon, start_lat], [end_lon, end_lat]],
-            'road_id': f'mock_road_{i}',
-            'road_name': f'道路_{i+1}',
-            'speed': speed,
-            'congestion': congestion,
-            'color': get_color_rgb(congestion),
-            'width': get_width_by_congestion(congestion)
-        }
-        roads_data.append(road_info)
+    # ランダムな道路線を生成
+    start_lat = rng.normal(center_lat, 0.005, n_roads)
+    start_lon = rng.normal(center_lon, 0.005, n_roads)
+    end_lat = start_lat + rng.normal(0, 0.003, n_roads)
+    end_lon = start_lon + rng.normal(0, 0.003, n_roads)
+    
+    speed = np.clip(rng.normal(25, 10, n_roads), 5, 60)
+    
+    # 混雑度コード（PYDECK_LEVEL_ORDER: low=0, medium=1, high=2）
+    codes = np.select([speed >= 30, speed >= 20], [0, 1], default=2)
     
-    return pd.DataFrame(roads_data)
+    # 道路ごとの[[始点lon, lat], [終点lon, lat]]
+    paths = np.stack([
+        np.column_stack([start_lon, start_lat]),
+        np.column_stack([end_lon, end_lat])
+    ], axis=1)
+    
+    ids = np.arange(n_roads).astype(str)
+    return pd.DataFrame({
+        'path': paths.tolist(),
+        'road_id': np.char.add('mock_road_', ids),
+        'road_name': np.char.add('道路_', (np.arange(n_roads) + 1).astype(str)),
+        'speed': speed,
+        'congestion': pd.Categorical.from_codes(codes, categories=PYDECK_LEVEL_ORDER),
+        'color': PYDECK_RGBA[codes].tolist(),
+        'width': PYDECK_WIDTH_TABLE[codes]
+    })
+
+# センターマーカーのレイヤーデータ（既定の中心用）
+_UNIVERSITY_DATA = [{'lat': TMDU_CENTER[0], 'lon': TMDU_CENTER[1], 'name': 'センター'}]
 
 def create_pydeck_map(roads_df, center=TMDU_CENTER):
     """PyDeckマップ作成"""
     
-    # 道路レイヤー
+    # 道路レイヤー（描画・ツールチップで参照する列のみJSONに含める）
     road_layer = pdk.Layer(
         "PathLayer",
-        data=roads_df,
+        data=roads_df[['path', 'color', 'width', 'road_name', 'speed', 'congestion']],
         get_path="path",
         get_color="color",
         get_width="width",
@@ -232,12 +271,11 @@ def create_pydeck_map(roads_df, center=TMDU_CENTER):
         auto_highlight=True
     )
     
-    # センターマーカー
-    university_data = [{
-        'lat': center[0],
-        'lon': center[1],
-        'name': 'センター'
-    }]
+    # センターマーカー（既定の中心なら事前に作成したデータを再利用）
+    if center == TMDU_CENTER:
+        university_data = _UNIVERSITY_DATA
+    else:
+        university_data = [{'lat': center[0], 'lon': center[1], 'name': 'センター'}]
     
     university_layer = pdk.Layer(
         "ScatterplotLayer",
@@ -307,8 +345,9 @@ def main():
     with col1:
         st.subheader("🗺️ 3D交通状況マップ")
         
-        # データ読み込み
-        roads_df, status_info = load_and_process_data()
+        # データ読み込み（処理結果はstatus_infoとして右カラムにまとめて表示）
+        with st.spinner("🔄 データを読み込み・処理中..."):
+            roads_df, status_info = load_and_process_data()
         
         if not roads_df.empty and status_info["status"] == "success":
             # PyDeckマップ表示
@@ -367,12 +406,16 @@ def main():
         if not roads_df.empty:
             st.subheader("📈 統計情報")
             
-            # 混雑度分布
-            congestion_counts = roads_df['congestion'].value_counts()
+            # 混雑度分布（コード化して1パスで集計、未知の値は'unknown'に計上）
+            codes = pd.Categorical(roads_df['congestion'], categories=PYDECK_LEVEL_ORDER).codes
+            codes = np.where(codes < 0, PYDECK_LEVEL_ORDER.index('unknown'), codes)
+            congestion_counts = np.bincount(codes, minlength=len(PYDECK_LEVEL_ORDER))
             
-            for congestion, count in congestion_counts.items():
-                emoji = {'low': '🟢', 'medium': '🟡', 'high': '🔴', 'unknown': '⚫'}.get(congestion, '❓')
-                label = {'low': '空いている', 'medium': 'やや混雑', 'high': '混雑', 'unknown': '不明'}.get(congestion, '不明')
+            for congestion, count in zip(PYDECK_LEVEL_ORDER, congestion_counts.tolist()):
+                if count == 0:
+                    continue
+                emoji = {'low': '🟢', 'medium': '🟡', 'high': '🔴', 'unknown': '⚫'}[congestion]
+                label = {'low': '空いている', 'medium': 'やや混雑', 'high': '混雑', 'unknown': '不明'}[congestion]
                 st.write(f"{emoji} {label}: {count}路線")
             
             # 平均速度
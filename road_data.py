@@ -1,17 +1,40 @@
 """道路データ処理モジュール"""
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+from shapely.geometry import box
 import zipfile
 from pathlib import Path
 from typing import Optional, Tuple
 import logging
 from config import ROAD_DATA_ZIP
 
+# pyogrioのインポート（利用可能ならGDALから列単位で一括読込、なければfionaにフォールバック）
+try:
+    import pyogrio
+    READ_ENGINE = 'pyogrio'
+except ImportError:
+    READ_ENGINE = 'fiona'
+
+# KSJ標準スキーマの列名対応
+KSJ_COLUMN_MAPPING = {
+    'N01_002': 'road_id',
+    'N01_001': 'road_class', 
+    'N01_003': 'road_name',
+    'N01_004': 'road_number'
+}
+
 class RoadDataLoader:
     """KSJ道路データ読込・処理クラス"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self._cached_roads: Optional[gpd.GeoDataFrame] = None
+        self._cached_bbox: Optional[Tuple[float, float, float, float]] = None  # キャッシュ読込時のBBOX（Noneは全域）
+        self._road_tree: Optional[shapely.STRtree] = None  # キャッシュ道路の空間インデックス
+        self._road_tree_source: Optional[gpd.GeoDataFrame] = None  # 空間インデックスの構築元フレーム
     
     def load_road_network(self, zip_path: Path = None, 
                          bbox: Optional[Tuple[float, float, float, float]] = None) -> gpd.GeoDataFrame:
@@ -29,21 +52,28 @@ class RoadDataLoader:
             zip_path = Path(ROAD_DATA_ZIP)
         
         try:
-            # キャッシュから読込（同じファイルの場合）
-            if self._cached_roads is not None:
+            # キャッシュから読込（全域、または同じBBOXで読込済みの場合）
+            # キャッシュは複製せず共有（BBOX抽出・浅いコピーで新しいフレームにしてから標準化する）
+            if self._cached_roads is not None and self._cached_bbox in (None, bbox):
                 self.logger.info("Using cached road data")
-                roads = self._cached_roads.copy()
+                roads = self._cached_roads
             else:
+                # BBOXがあれば読込時に絞り込み（範囲外の道路はメモリに載せない）
                 self.logger.info(f"Loading road data from {zip_path}")
-                roads = self._load_from_zip(zip_path)
-                self._cached_roads = roads.copy()  # キャッシュ保存
+                roads = self._load_from_zip(zip_path, bbox)
+                self._cached_roads = roads  # キャッシュ保存
+                self._cached_bbox = bbox
+                self._road_tree = None  # 空間インデックスは初回のBBOX検索時に構築
+                self._road_tree_source = None
                 self.logger.info(f"Loaded {len(roads)} road segments")
             
-            # BBOX フィルタリング
+            # BBOX フィルタリング（読込時の絞り込みは外接矩形単位のため、交差判定で確定させる）
             if bbox:
                 before_count = len(roads)
                 roads = self._filter_by_bbox(roads, bbox)
                 self.logger.info(f"Filtered by bbox: {before_count} -> {len(roads)} roads")
+            else:
+                roads = roads.copy(deep=False)  # 列の追加・置換がキャッシュに及ばないよう別フレームにする
             
             # スキーマ標準化
             roads = self._standardize_road_schema(roads)
@@ -54,11 +84,43 @@ class RoadDataLoader:
             self.logger.error(f"Road data loading failed: {e}")
             return gpd.GeoDataFrame()
     
-    def _load_from_zip(self, zip_path: Path) -> gpd.GeoDataFrame:
-        """ZIPファイルからShapefile読込"""
+    def _load_from_zip(self, zip_path: Path,
+                       bbox: Optional[Tuple[float, float, float, float]] = None) -> gpd.GeoDataFrame:
+        """ZIPファイルからShapefile読込（変換済みデータのParquetキャッシュがあればそちらを使用）"""
         if not zip_path.exists():
             raise FileNotFoundError(f"Road data file not found: {zip_path}")
         
+        # ZIPより新しいキャッシュがあればShapefile解析・CRS変換を省略（EPSG:4326で保存済み、BBOXごとに別ファイル）
+        cache_path = self._cache_path(zip_path, bbox)
+        if cache_path.exists() and cache_path.stat().st_mtime >= zip_path.stat().st_mtime:
+            try:
+                gdf = gpd.read_parquet(cache_path)
+                self.logger.info(f"Loaded road data from cache: {cache_path}")
+                return gdf
+            except Exception as e:
+                self.logger.warning(f"Road data cache read failed, reloading from ZIP: {e}")
+        
+        gdf = self._read_shapefile(zip_path, bbox)
+        
+        try:
+            gdf.to_parquet(cache_path, compression='zstd')
+            self.logger.info(f"Saved road data cache: {cache_path}")
+        except Exception as e:
+            self.logger.warning(f"Road data cache write failed: {e}")
+        
+        return gdf
+    
+    @staticmethod
+    def _cache_path(zip_path: Path, bbox: Optional[Tuple[float, float, float, float]]) -> Path:
+        """Parquetキャッシュのパス（BBOX指定時はBBOXをファイル名に含める）"""
+        if bbox is None:
+            return zip_path.with_suffix('.parquet')
+        bbox_key = '_'.join(f"{v:.5f}" for v in bbox)
+        return zip_path.with_name(f"{zip_path.stem}_bbox_{bbox_key}.parquet")
+    
+    def _read_shapefile(self, zip_path: Path,
+                        bbox: Optional[Tuple[float, float, float, float]] = None) -> gpd.GeoDataFrame:
+        """ZIP内のShapefileを読込みEPSG:4326に変換（BBOX指定時は範囲内の地物のみ読込）"""
         with zipfile.ZipFile(zip_path) as zf:
             shp_files = [name for name in zf.namelist() if name.endswith('.shp')]
             if not shp_files:
@@ -76,8 +138,23 @@ class RoadDataLoader:
                 
             self.logger.info(f"Loading shapefile: {road_shp}")
         
+        shp_path = f"zip://{zip_path}!{road_shp}"
+        
+        # 読込範囲（ファイルのCRSが未定義・経緯度ならBBOXをそのまま渡し、
+        # 投影座標系のファイルの場合のみEPSG:4326付きのGeoSeriesで渡して変換をgeopandasに任せる）
+        read_kwargs = {}
+        if bbox is not None:
+            source_crs = self._source_crs(shp_path)
+            if source_crs is None or source_crs.is_geographic:
+                read_kwargs['bbox'] = tuple(bbox)
+            else:
+                read_kwargs['bbox'] = gpd.GeoSeries([box(*bbox)], crs='EPSG:4326')
+        
         # Shapefileを読込
-        gdf = gpd.read_file(f"zip://{zip_path}!{road_shp}")
+        if READ_ENGINE == 'pyogrio':
+            # スキーマ標準化で使う属性列のみ読込（他の属性はGDAL側で読み飛ばす、存在しない列名は無視される）
+            read_kwargs['columns'] = [*KSJ_COLUMN_MAPPING, *KSJ_COLUMN_MAPPING.values()]
+        gdf = gpd.read_file(shp_path, engine=READ_ENGINE, **read_kwargs)
         
         # CRS変換（JGD2000 → WGS84）
         if gdf.crs is not None:
@@ -90,51 +167,49 @@ class RoadDataLoader:
         
         return gdf
     
+    @staticmethod
+    def _source_crs(shp_path: str) -> Optional[pyproj.CRS]:
+        """Shapefileに定義されたCRS（.prjがない場合はNone、属性・形状は読まない）"""
+        if READ_ENGINE == 'pyogrio':
+            crs = pyogrio.read_info(shp_path)['crs']
+        else:
+            import fiona
+            with fiona.open(shp_path) as src:
+                crs = src.crs_wkt or None
+        return pyproj.CRS.from_user_input(crs) if crs else None
+    
     def _filter_by_bbox(self, gdf: gpd.GeoDataFrame, 
                        bbox: Tuple[float, float, float, float]) -> gpd.GeoDataFrame:
         """BBOX による空間フィルタリング"""
         minx, miny, maxx, maxy = bbox
         
-        # cx indexerを使用した効率的なフィルタリング
-        try:
-            filtered_gdf = gdf.cx[minx:maxx, miny:maxy]
-            return filtered_gdf
-        except Exception as e:
-            self.logger.warning(f"Spatial filtering failed, using bounds method: {e}")
-            
-            # フォールバック: bounds を使用
-            bounds = gdf.bounds
-            mask = (
-                (bounds['minx'] <= maxx) & (bounds['maxx'] >= minx) &
-                (bounds['miny'] <= maxy) & (bounds['maxy'] >= miny)
-            )
-            return gdf[mask]
+        # STRtreeでBBOXと交差する道路のみ検索（構築元と同じフレームの場合のみ木を再利用）
+        if self._road_tree is None or gdf is not self._road_tree_source:
+            self._road_tree = shapely.STRtree(np.asarray(gdf.geometry.values))
+            self._road_tree_source = gdf
+        idx = self._road_tree.query(box(minx, miny, maxx, maxy), predicate='intersects')
+        return gdf.iloc[np.sort(idx)]
     
     def _standardize_road_schema(self, gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         """道路データのスキーマ標準化"""
         if gdf.empty:
             return gdf
         
-        # KSJ標準スキーマ対応
-        column_mapping = {
-            'N01_002': 'road_id',
-            'N01_001': 'road_class', 
-            'N01_003': 'road_name',
-            'N01_004': 'road_number'
-        }
-        
         # 列名変更（存在する列のみ）
-        available_columns = {k: v for k, v in column_mapping.items() if k in gdf.columns}
+        available_columns = {k: v for k, v in KSJ_COLUMN_MAPPING.items() if k in gdf.columns}
         if available_columns:
             gdf = gdf.rename(columns=available_columns)
             self.logger.info(f"Renamed columns: {available_columns}")
         
-        # road_idの標準化
+        # road_idの標準化（整数列はNumPyの文字列配列で一括ゼロ埋め）
         if 'road_id' in gdf.columns:
-            gdf['road_id'] = gdf['road_id'].astype(str).str.zfill(3)
+            if pd.api.types.is_integer_dtype(gdf['road_id']):
+                gdf['road_id'] = np.char.zfill(gdf['road_id'].to_numpy().astype(str), 3)
+            else:
+                gdf['road_id'] = gdf['road_id'].astype(str).str.zfill(3)
         elif gdf.index.name is None:
             # road_idが無い場合はindexから生成
-            gdf['road_id'] = gdf.index.astype(str).str.zfill(6)
+            gdf['road_id'] = np.char.zfill(gdf.index.to_numpy().astype(str), 6)
             self.logger.info("Generated road_id from index")
         
         # 道路名の処理
@@ -153,13 +228,14 @@ class RoadDataLoader:
             self.logger.error("Geometry column not found in road data")
             return gpd.GeoDataFrame()
         
-        result = gdf[existing_columns].copy()
+        result = gdf[existing_columns]
         
-        # ジオメトリの検証
-        invalid_geom = result['geometry'].isna() | (~result['geometry'].is_valid)
+        # ジオメトリの検証（shapelyのufuncでGeometryArrayを一括判定）
+        geoms = result.geometry.values
+        invalid_geom = shapely.is_missing(geoms) | ~shapely.is_valid(geoms)
         if invalid_geom.any():
-            invalid_count = invalid_geom.sum()
-            result = result[~invalid_geom]
+            invalid_count = int(invalid_geom.sum())
+            result = result.iloc[~invalid_geom]
             self.logger.warning(f"Removed {invalid_count} records with invalid geometry")
         
         return result
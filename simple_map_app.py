@@ -3,10 +3,13 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import plotly.express as px
 import plotly.graph_objects as go
+import pydeck as pdk
 import logging
 import geopandas as gpd
+import shapely
 from pathlib import Path
 
 # アプリケーションモジュール
@@ -14,7 +17,7 @@ try:
     from traffic_data import TrafficDataFetcher
     from road_data import RoadDataLoader
     from spatial_processor import SpatialProcessor
-    from congestion_analyzer import CongestionAnalyzer
+    from congestion_analyzer import CongestionAnalyzer, CONGESTION_LEVEL_ORDER, CONGESTION_RGBA
     from config import BBOX_5KM, TMDU_CENTER, CONGESTION_COLORS, ROAD_DATA_ZIP
 except ImportError as e:
     st.error(f"モジュールのインポートに失敗しました: {e}")
@@ -27,6 +30,54 @@ st.set_page_config(
     layout="wide"
 )
 
+# 表示用DataFrameの列型（キャッシュ・ブラウザ転送量を抑えるため数値はfloat32、文字列はカテゴリ）
+RESULT_DTYPES = {
+    'latitude': 'float32',
+    'longitude': 'float32',
+    'speed': 'float32',
+    'travel_time': 'float32',
+    'link_length': 'float32',
+    'congestion': 'category',
+    'congestion_level': pd.CategoricalDtype(CONGESTION_LEVEL_ORDER),  # コードでCONGESTION_RGBAを参照
+}
+
+# 分析結果の列 → 表示用DataFrameの列
+RESULT_COLUMNS = {
+    '平均速度': 'speed',
+    '旅行時間': 'travel_time',
+    'リンク長': 'link_length',
+    'speed_category': 'congestion',
+    'congestion_level': 'congestion_level',
+    'road_name': 'road_name',
+    'road_id': 'road_id',
+    'observation_count': 'observation_count'
+}
+
+# 分析結果に列がない場合の既定値
+RESULT_DEFAULTS = {
+    'speed': 0,
+    'travel_time': 0,
+    'link_length': 0,
+    'congestion': 'データなし',
+    'congestion_level': 'unknown',
+    'road_name': '未分類道路',
+    'road_id': '',
+    'observation_count': 0
+}
+
+@st.cache_resource(show_spinner=False)
+def load_road_resources():
+    """道路データと空間インデックス構築済みの空間処理オブジェクト（変化しないためpickleせずプロセス内共有）"""
+    road_data = RoadDataLoader().load_road_network(bbox=BBOX_5KM)
+    spatial_processor = SpatialProcessor(max_distance=100)  # 100m範囲でマッチング
+    spatial_processor.prepare_roads(road_data)
+    return road_data, spatial_processor
+
+@st.cache_data(max_entries=16, persist="disk", show_spinner=False)
+def fetch_traffic_data_cached(bbox, time_code):
+    """交通データ取得（BBOX・時間コードをキーにディスク保存、再起動後も同じ時間帯は再取得しない）"""
+    return TrafficDataFetcher(use_mock=True).fetch_traffic_data(bbox, time_code)
+
 @st.cache_data(ttl=300)  # 5分間キャッシュ
 def load_real_traffic_data():
     """実交通データ読込・処理"""
@@ -36,23 +87,25 @@ def load_real_traffic_data():
         
         # データ処理クラス初期化
         traffic_fetcher = TrafficDataFetcher(use_mock=True)  # モック優先（API失敗時のフォールバック）
-        road_loader = RoadDataLoader()
-        spatial_processor = SpatialProcessor(max_distance=100)  # 100m範囲でマッチング
         congestion_analyzer = CongestionAnalyzer()
         
-        with st.spinner('📡 交通データを取得中...'):
-            # 交通データ取得
-            traffic_data = traffic_fetcher.fetch_traffic_data(BBOX_5KM)
+        with st.spinner('📡 交通データ取得・道路データ読込中...'):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # 交通データ取得（HTTP待ちのため別スレッドで実行、時間コードが変わるまではキャッシュを利用）
+                time_code = traffic_fetcher.get_current_time_code()
+                traffic_future = executor.submit(fetch_traffic_data_cached, BBOX_5KM, time_code)
+                
+                # 道路データ読込（交通データ取得と並行、キャッシュ利用のためメインスレッドで実行）
+                road_data, spatial_processor = load_road_resources()
+                
+                traffic_data = traffic_future.result()
             
             if traffic_data is None or traffic_data.empty:
                 st.warning("交通データの取得に失敗しました。モックデータを表示します。")
                 return create_fallback_data()
-        
-        with st.spinner('🛣️ 道路データを読込中...'):
-            # 道路データ読込
-            road_data = road_loader.load_road_network(bbox=BBOX_5KM)
             
             if road_data.empty:
+                load_road_resources.clear()  # 読込失敗は次回再試行させる
                 st.error(f"道路データファイルが見つかりません: {ROAD_DATA_ZIP}")
                 return create_fallback_data()
         
@@ -65,7 +118,7 @@ def load_real_traffic_data():
                 return create_fallback_data()
             
             # 道路ごと集約
-            aggregated_data = spatial_processor.aggregate_by_road(joined_data)
+            aggregated_data = spatial_processor.aggregate_by_road(joined_data, road_data)
             
             if aggregated_data.empty:
                 st.warning("データの集約に失敗しました。")
@@ -77,23 +130,18 @@ def load_real_traffic_data():
             
             # pandas DataFrameに変換（Plotly用）
             if hasattr(congestion_data, 'geometry'):
-                # 道路の中心点を取得（線データから点データへ）
-                congestion_data = congestion_data.copy()
-                centroids = congestion_data.geometry.centroid
+                # 道路の中心点を取得（線データから点データへ、GEOSの一括処理で座標配列を取得）
+                centroids = shapely.centroid(congestion_data.geometry.values)
                 
-                result_df = pd.DataFrame({
-                    'latitude': centroids.y,
-                    'longitude': centroids.x,
-                    'speed': congestion_data.get('平均速度', 0),
-                    'travel_time': congestion_data.get('旅行時間', 0),
-                    'link_length': congestion_data.get('リンク長', 0),
-                    'congestion': congestion_data.get('speed_category', 'データなし'),
-                    'congestion_level': congestion_data.get('congestion_level', 'unknown'),
-                    'color': congestion_data.get('congestion_color', '#808080'),
-                    'road_name': congestion_data.get('road_name', '未分類道路'),
-                    'road_id': congestion_data.get('road_id', ''),
-                    'observation_count': congestion_data.get('observation_count', 0)
-                })
+                # 存在する列は一括で取り出して改名、ない列のみ既定値で追加
+                present = [col for col in RESULT_COLUMNS if col in congestion_data.columns]
+                result_df = pd.DataFrame(congestion_data[present]).rename(columns=RESULT_COLUMNS)
+                missing = {col: value for col, value in RESULT_DEFAULTS.items() if col not in result_df.columns}
+                result_df = result_df.assign(
+                    latitude=shapely.get_y(centroids),
+                    longitude=shapely.get_x(centroids),
+                    **missing
+                )[['latitude', 'longitude', *RESULT_DEFAULTS]].astype(RESULT_DTYPES)
             else:
                 result_df = pd.DataFrame(congestion_data)
             
@@ -105,7 +153,8 @@ def load_real_traffic_data():
             # 統計情報を返す
             stats = congestion_analyzer.generate_statistics(congestion_data)
             
-            return result_df, stats, congestion_data
+            # キャッシュするのは表示用の小さな結果のみ（GeoDataFrameは返さない）
+            return result_df, stats, None
             
     except FileNotFoundError as e:
         st.error(f"ファイルが見つかりません: {e}")
@@ -117,45 +166,34 @@ def load_real_traffic_data():
 
 def create_fallback_data():
     """フォールバックデータ生成（処理失敗時用）"""
-    np.random.seed(42)
+    rng = np.random.default_rng(42)
     
     # センター周辺の座標
     center_lat, center_lon = TMDU_CENTER
     
     # ランダムな道路データ生成
     n_roads = 50
-    lats = np.random.normal(center_lat, 0.01, n_roads)
-    lons = np.random.normal(center_lon, 0.01, n_roads)
-    speeds = np.random.normal(25, 10, n_roads)
+    lats = rng.normal(center_lat, 0.01, n_roads)
+    lons = rng.normal(center_lon, 0.01, n_roads)
+    speeds = rng.normal(25, 10, n_roads)
     speeds = np.clip(speeds, 5, 60)  # 5-60km/h
     
-    # 混雑度カテゴリ
-    congestion = []
-    colors = []
-    for speed in speeds:
-        if speed >= 30:
-            congestion.append('空いている')
-            colors.append('green')
-        elif speed >= 20:
-            congestion.append('やや混雑')
-            colors.append('orange')
-        else:
-            congestion.append('混雑')
-            colors.append('red')
+    # 混雑度カテゴリ（0: 空いている, 1: やや混雑, 2: 混雑 のコードで一括分類）
+    codes = np.select([speeds >= 30, speeds >= 20], [0, 1], default=2)
+    congestion = np.array(['空いている', 'やや混雑', '混雑'])[codes]
     
     df = pd.DataFrame({
         'latitude': lats,
         'longitude': lons,
         'speed': speeds,
-        'travel_time': np.random.uniform(10, 60, n_roads),
-        'link_length': np.random.uniform(50, 200, n_roads),
+        'travel_time': rng.uniform(10, 60, n_roads),
+        'link_length': rng.uniform(50, 200, n_roads),
         'congestion': congestion,
-        'congestion_level': ['low' if c == '空いている' else 'medium' if c == 'やや混雑' else 'high' for c in congestion],
-        'color': colors,
-        'road_name': [f'道路_{i+1}' for i in range(n_roads)],
-        'road_id': [f'R{i:03d}' for i in range(n_roads)],
-        'observation_count': np.random.randint(1, 5, n_roads)
-    })
+        'congestion_level': np.array(['low', 'medium', 'high'])[codes],
+        'road_name': np.char.add('道路_', np.arange(1, n_roads + 1).astype(str)),
+        'road_id': np.char.add('R', np.char.zfill(np.arange(n_roads).astype(str), 3)),
+        'observation_count': rng.integers(1, 5, n_roads)
+    }).astype(RESULT_DTYPES)
     
     # 簡単な統計
     stats = {
@@ -173,6 +211,64 @@ def create_fallback_data():
     
     return df, stats, None
 
+# センターマーカーのレイヤーデータ
+_CENTER_DATA = [{'lat': TMDU_CENTER[0], 'lon': TMDU_CENTER[1], 'road_name': 'センター'}]
+
+def create_scatter_deck(df):
+    """PyDeck散布図マップ作成（描画・ツールチップで参照する列のみJSONに含める）"""
+    # 混雑度コードから色を一括参照（欠損コード-1は末尾のunknownの色）
+    codes = df['congestion_level'].cat.codes.to_numpy()
+    points = pd.DataFrame({
+        'longitude': df['longitude'],
+        'latitude': df['latitude'],
+        'speed': df['speed'].round(1),
+        'travel_time': df['travel_time'].round(1),
+        'color': CONGESTION_RGBA[codes].tolist(),
+        'congestion': df['congestion'],
+        'road_name': df['road_name'],
+        'road_id': df['road_id'],
+        'observation_count': df['observation_count']
+    })
+    
+    road_layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=points,
+        get_position=['longitude', 'latitude'],
+        get_radius='speed * 2',
+        get_fill_color='color',
+        radius_min_pixels=3,
+        pickable=True,
+        auto_highlight=True
+    )
+    
+    center_layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=_CENTER_DATA,
+        get_position=['lon', 'lat'],
+        get_fill_color=[0, 0, 255, 200],
+        get_radius=60,
+        radius_min_pixels=6,
+        pickable=True
+    )
+    
+    return pdk.Deck(
+        layers=[road_layer, center_layer],
+        initial_view_state=pdk.ViewState(
+            latitude=TMDU_CENTER[0],
+            longitude=TMDU_CENTER[1],
+            zoom=13
+        ),
+        tooltip={
+            "html": "<b>{road_name}</b><br/>"
+                   "道路ID: {road_id}<br/>"
+                   "平均速度: {speed} km/h<br/>"
+                   "旅行時間: {travel_time} 秒<br/>"
+                   "混雑度: {congestion}<br/>"
+                   "観測点数: {observation_count}"
+        },
+        map_style='light'
+    )
+
 def main():
     st.title("🚗 センター周辺 交通混雑度マップ（実データ版）")
     st.markdown("---")
@@ -239,54 +335,8 @@ def main():
             # データ品質表示
             st.caption(f"データソース: {data_source} | 道路数: {len(df)}路線 | 更新: {datetime.now().strftime('%H:%M:%S')}")
             
-            # Plotly散布図マップ
-            fig = px.scatter_mapbox(
-                df, 
-                lat="latitude", 
-                lon="longitude",
-                color="congestion",
-                size="speed",
-                hover_name="road_name",
-                hover_data={
-                    "speed": ":.1f",
-                    "travel_time": ":.1f",
-                    "link_length": ":.1f",
-                    "congestion": True,
-                    "road_id": True,
-                    "observation_count": True
-                },
-                color_discrete_map={
-                    '空いている': 'green',
-                    'やや混雑': 'yellow', 
-                    '混雑': 'red',
-                    'データなし': 'gray'
-                },
-                zoom=13,
-                height=600,
-                title="リアルタイム交通状況（実データ）"
-            )
-            
-            # センターマーカー追加
-            fig.add_trace(go.Scattermapbox(
-                lat=[TMDU_CENTER[0]],
-                lon=[TMDU_CENTER[1]],
-                mode='markers',
-                marker=dict(size=15, color='blue', symbol='star'),
-                text=['センター'],
-                name='センター',
-                showlegend=True
-            ))
-            
-            fig.update_layout(
-                mapbox_style="open-street-map",
-                mapbox=dict(
-                    center=dict(lat=TMDU_CENTER[0], lon=TMDU_CENTER[1])
-                ),
-                margin={"r":0,"t":30,"l":0,"b":0},
-                showlegend=True
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            # PyDeck散布図マップ（WebGLで描画）
+            st.pydeck_chart(create_scatter_deck(df), use_container_width=True)
     
     with col2:
         st.subheader("📊 統計情報")
@@ -340,11 +390,20 @@ def main():
             
             # 速度分布ヒストグラム
             if 'speed' in df.columns and df['speed'].notna().any():
-                fig_hist = px.histogram(
-                    df, x="speed", nbins=15,
+                # NumPyで集計済みの棒グラフとして描画（ブラウザ側でのビン計算を省く）
+                speeds = df['speed'].dropna().to_numpy(dtype=np.float32)
+                counts, edges = np.histogram(speeds, bins=15)
+                fig_hist = go.Figure(go.Bar(
+                    x=(edges[:-1] + edges[1:]) / 2,
+                    y=counts,
+                    width=np.diff(edges),
+                    marker_color='skyblue'
+                ))
+                fig_hist.update_layout(
                     title="速度分布",
-                    labels={"speed": "速度 (km/h)", "count": "道路数"},
-                    color_discrete_sequence=['skyblue']
+                    xaxis_title="速度 (km/h)",
+                    yaxis_title="道路数",
+                    bargap=0
                 )
                 st.plotly_chart(fig_hist, use_container_width=True)
             
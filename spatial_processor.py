@@ -1,10 +1,19 @@
 """空間データ統合処理モジュール"""
 import geopandas as gpd
 import pandas as pd
+import shapely
 from shapely.geometry import Point
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import logging
 import numpy as np
+from config import ROAD_SIMPLIFY_TOLERANCE, ROAD_COORD_PRECISION
+
+# 集約後の数値列の型（float64/int64からの縮小）
+AGGREGATED_DTYPES = {
+    '平均速度': 'float32',
+    '旅行時間': 'float32',
+    'observation_count': 'int32'
+}
 
 class SpatialProcessor:
     """空間データ統合処理クラス"""
@@ -12,7 +21,62 @@ class SpatialProcessor:
     def __init__(self, max_distance: float = 50.0):
         self.max_distance = max_distance  # 最大マッチング距離（メートル）
         self.logger = logging.getLogger(__name__)
-        self._road_gdf = None  # 道路データを保存
+        self._road_source: Optional[gpd.GeoDataFrame] = None  # 準備済みの道路データ（同一オブジェクトなら再利用）
+        self._prepared: Optional[Tuple[gpd.GeoSeries, pd.DataFrame, gpd.GeoSeries]] = None  # 準備済みの道路（読取専用）
+    
+    def prepare_roads(self, road_gdf: gpd.GeoDataFrame) -> None:
+        """
+        道路データの投影変換・空間インデックス構築（以降の結合・集約で再利用）
+        
+        生成時に1回だけ呼び出す。準備済みの状態は結合・集約では書き換えないため、
+        同じオブジェクトを複数セッションで共有できる。
+        
+        Args:
+            road_gdf: 道路データ（線データ）
+        """
+        if road_gdf is None or road_gdf.empty:
+            return
+        
+        prepared = self._build_road_index(road_gdf)
+        self._prepared, self._road_source = prepared, road_gdf
+        
+        self.logger.info(f"Prepared spatial index for {len(road_gdf)} road segments")
+    
+    def _prepared_for(self, road_gdf: gpd.GeoDataFrame) -> Tuple[gpd.GeoSeries, pd.DataFrame, gpd.GeoSeries]:
+        """準備済みの道路データならその結果、別の道路データならこの呼び出し限りの結果を返す"""
+        prepared, source = self._prepared, self._road_source
+        if prepared is not None and road_gdf is source:
+            return prepared
+        return self._build_road_index(road_gdf)
+    
+    @staticmethod
+    def _build_road_index(road_gdf: gpd.GeoDataFrame) -> Tuple[gpd.GeoSeries, pd.DataFrame, gpd.GeoSeries]:
+        """
+        道路の投影形状・結合用属性・道路ID → ジオメトリの対応を作成
+        
+        Returns:
+            (メートル単位CRSの道路形状（空間インデックス構築済み）, 結合で付与する道路属性（位置で参照）,
+             道路ID → ジオメトリ（集約で使用）)
+        """
+        # メートル単位のCRSに変換（距離計算のため）し、空間インデックスをここで構築
+        road_utm = road_gdf.geometry.to_crs('EPSG:3857')
+        _ = road_utm.sindex
+        
+        # 道路データから必要な列のみ選択
+        road_columns = ['road_id']
+        if 'road_name' in road_gdf.columns:
+            road_columns.append('road_name')
+        if 'road_class' in road_gdf.columns:
+            road_columns.append('road_class')
+        
+        # 道路ID → ジオメトリの対応（集約で使用、IDが重複する場合は最初の道路）
+        first = ~road_gdf['road_id'].duplicated().to_numpy()
+        road_geom_by_id = gpd.GeoSeries(
+            road_gdf.geometry.values[first],
+            index=pd.Index(road_gdf['road_id'].to_numpy()[first], name='road_id'),
+            crs=road_gdf.crs
+        )
+        return road_utm, road_gdf[road_columns].reset_index(drop=True), road_geom_by_id
     
     def join_traffic_roads(self, traffic_gdf: gpd.GeoDataFrame, 
                           road_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
@@ -34,38 +98,42 @@ class SpatialProcessor:
             self.logger.info(f"Starting spatial join: {len(traffic_gdf)} traffic points, "
                            f"{len(road_gdf)} road segments")
             
-            # CRS の確認と統一
+            # CRS の確認と統一（道路データは準備済みの状態を使うため交通データのみ変換）
             if traffic_gdf.crs != road_gdf.crs:
-                self.logger.info("CRS mismatch detected, converting to EPSG:4326")
-                traffic_gdf = traffic_gdf.to_crs('EPSG:4326')
-                road_gdf = road_gdf.to_crs('EPSG:4326')
-            
-            # メートル単位のCRSに変換（距離計算のため）
-            traffic_utm = traffic_gdf.to_crs('EPSG:3857')
-            road_utm = road_gdf.to_crs('EPSG:3857')
+                self.logger.info(f"CRS mismatch detected, converting traffic data to {road_gdf.crs}")
+                traffic_gdf = traffic_gdf.to_crs(road_gdf.crs)
             
-            # 道路データから必要な列のみ選択
-            road_columns = ['road_id', 'geometry']
-            if 'road_name' in road_gdf.columns:
-                road_columns.append('road_name')
-            if 'road_class' in road_gdf.columns:
-                road_columns.append('road_class')
+            # 道路の投影・空間インデックスは準備済みの道路データなら再利用（共有状態は書き換えない）
+            road_utm, road_attrs, _ = self._prepared_for(road_gdf)
             
-            road_utm_selected = road_utm[road_columns].copy()
+            # メートル単位のCRSに変換（距離計算のため、属性列は持ち回さず形状のみ）
+            traffic_utm = traffic_gdf.geometry.to_crs('EPSG:3857')
             
-            # 最近傍結合
+            # 最近傍探索（空間インデックスで位置の組を求め、列は位置で取り出す）
             self.logger.info(f"Performing spatial join with max distance: {self.max_distance}m")
             
-            joined = gpd.sjoin_nearest(
-                traffic_utm, 
-                road_utm_selected, 
-                how='left',
+            (left_pos, right_pos), distances = road_utm.sindex.nearest(
+                traffic_utm.values,
                 max_distance=self.max_distance,
-                distance_col='distance_to_road'
+                return_distance=True
             )
             
-            # 元のCRSに戻す
-            joined = joined.to_crs('EPSG:4326')
+            # 一致しなかった点も残す（左結合）
+            unmatched = np.setdiff1d(np.arange(len(traffic_utm)), left_pos)
+            left_pos = np.concatenate([left_pos, unmatched])
+            right_pos = np.concatenate([right_pos, np.full(len(unmatched), -1, dtype=right_pos.dtype)])
+            distances = np.concatenate([distances, np.full(len(unmatched), np.nan)])
+            order = np.argsort(left_pos, kind='stable')
+            left_pos, right_pos, distances = left_pos[order], right_pos[order], distances[order]
+            
+            # 交通データの点・属性は元のデータから位置で取り出す（EPSG:4326以外の場合のみ変換）
+            joined = traffic_gdf.iloc[left_pos]
+            if joined.crs != 'EPSG:4326':
+                joined = joined.to_crs('EPSG:4326')
+            
+            matched_attrs = road_attrs.reindex(right_pos)  # -1 は欠損値になる
+            joined = joined.assign(**{col: matched_attrs[col].to_numpy() for col in matched_attrs.columns},
+                                   distance_to_road=distances)
             
             # 結合結果の統計
             matched_count = joined['road_id'].notna().sum()
@@ -83,9 +151,6 @@ class SpatialProcessor:
             self.logger.info(f"Spatial join completed: {matched_count}/{total_count} "
                            f"({match_rate:.1%}) matched")
             
-            # 道路データを保存（集約で使用）
-            self._road_gdf = road_gdf
-            
             return joined
             
         except Exception as e:
@@ -98,6 +163,7 @@ class SpatialProcessor:
         
         Args:
             joined_gdf: 空間結合済みデータ
+            road_gdf: 道路データ（ジオメトリの取得元、省略時は準備済みの道路データ）
             
         Returns:
             GeoDataFrame: 道路ごと集約データ
@@ -123,43 +189,55 @@ class SpatialProcessor:
             self.logger.warning("No numeric columns found for aggregation")
             return gpd.GeoDataFrame()
         
-        # 集約関数の定義
-        agg_functions = {}
+        # 集約関数の定義（列名 → (元の列, 関数) の名前付き集約）
+        named_aggs = {}
         
         # 数値列は平均値
         for col in available_numeric:
-            agg_functions[col] = 'mean'
+            named_aggs[col] = (col, 'mean')
         
         # 文字列列は最初の値
         string_columns = ['road_name', 'road_class']
         for col in string_columns:
             if col in valid_data.columns:
-                agg_functions[col] = 'first'
+                named_aggs[col] = (col, 'first')
         
         # 距離は平均
         if 'distance_to_road' in valid_data.columns:
-            agg_functions['distance_to_road'] = 'mean'
+            named_aggs['distance_to_road'] = ('distance_to_road', 'mean')
+        
+        # 観測点数も同じ集約で数える
+        named_aggs['observation_count'] = ('road_id', 'size')
         
         try:
-            # 道路ごと集約
-            aggregated = valid_data.groupby('road_id').agg(agg_functions).reset_index()
+            # 道路ごと集約（道路IDはカテゴリ化して整数コードでグループ化、キーの並べ替えは不要）
+            valid_data['road_id'] = valid_data['road_id'].astype('category')
+            aggregated = valid_data.groupby('road_id', sort=False, observed=True).agg(**named_aggs).reset_index()
+            aggregated['road_id'] = np.asarray(aggregated['road_id'])  # 道路ごとに一意なので元の値に戻す
+            
+            # 繰り返しの多い文字列列はカテゴリ型で保持（キャッシュされる結果のメモリ削減）
+            for col in string_columns:
+                if col in aggregated.columns:
+                    aggregated[col] = aggregated[col].astype('category')
             
-            # 観測点数を手動で追加
-            observation_counts = valid_data.groupby('road_id').size().reset_index(name='observation_count')
-            aggregated = aggregated.merge(observation_counts, on='road_id', how='left')
+            # 後段の統計処理向けに数値列をダウンキャスト
+            for col, dtype in AGGREGATED_DTYPES.items():
+                if col in aggregated.columns:
+                    aggregated[col] = pd.to_numeric(aggregated[col], errors='coerce').astype(dtype)
             
             # ジオメトリの取得（道路の線形状）
             # 元の道路データから正しいジオメトリを取得
-            if self._road_gdf is not None:
-                road_geom_dict = {}
-                for road_id in aggregated['road_id']:
-                    # 元の道路データから該当道路のジオメトリを取得
-                    matching_roads = self._road_gdf[self._road_gdf['road_id'] == road_id]
-                    if not matching_roads.empty:
-                        road_geom_dict[road_id] = matching_roads.iloc[0]['geometry']
-                
-                # ジオメトリを追加
-                aggregated['geometry'] = aggregated['road_id'].map(road_geom_dict)
+            if road_gdf is not None:
+                road_geom_by_id = self._prepared_for(road_gdf)[2]
+            else:
+                road_geom_by_id = self._prepared[2] if self._prepared is not None else None
+            
+            if road_geom_by_id is not None:
+                # 道路IDでインデックス済みのジオメトリを一括参照
+                geometry = road_geom_by_id.reindex(aggregated['road_id'])
+                if geometry.crs != 'EPSG:4326':
+                    geometry = geometry.to_crs('EPSG:4326')
+                aggregated['geometry'] = geometry.values
                 
                 # GeoDataFrame として作成
                 result_gdf = gpd.GeoDataFrame(aggregated, geometry='geometry', crs='EPSG:4326')
@@ -180,6 +258,34 @@ class SpatialProcessor:
             self.logger.error(f"Aggregation failed: {e}")
             return gpd.GeoDataFrame()
     
+    def simplify_geometries(self, gdf: gpd.GeoDataFrame,
+                            tolerance: float = ROAD_SIMPLIFY_TOLERANCE,
+                            grid_size: float = ROAD_COORD_PRECISION) -> gpd.GeoDataFrame:
+        """
+        表示用のジオメトリ簡略化・座標精度削減
+        
+        Args:
+            gdf: 道路データ（EPSG:4326）
+            tolerance: 簡略化許容誤差（度）
+            grid_size: 座標の丸め単位（度）
+            
+        Returns:
+            GeoDataFrame: 頂点数を削減したデータ
+        """
+        if gdf.empty or 'geometry' not in gdf.columns:
+            return gdf
+        
+        geoms = np.asarray(gdf.geometry.values)
+        before_count = int(shapely.get_num_coordinates(geoms).sum())
+        
+        geoms = shapely.simplify(geoms, tolerance, preserve_topology=False)
+        geoms = shapely.set_precision(geoms, grid_size)
+        
+        after_count = int(shapely.get_num_coordinates(geoms).sum())
+        self.logger.info(f"Simplified geometries: {before_count} -> {after_count} vertices")
+        
+        return gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs))
+    
     def calculate_road_coverage(self, traffic_gdf: gpd.GeoDataFrame, 
                                road_gdf: gpd.GeoDataFrame) -> Dict[str, Any]:
         """
@@ -265,7 +371,7 @@ def test_spatial_processor():
             
             # 集約テスト
             print("Testing aggregation...")
-            aggregated_data = processor.aggregate_by_road(joined_data)
+            aggregated_data = processor.aggregate_by_road(joined_data, road_data)
             
             if not aggregated_data.empty:
                 print(f"✅ Aggregation successful: {len(aggregated_data)} roads")
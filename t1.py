@@ -1,6 +1,12 @@
 import requests, json
 import pandas as pd
 
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
 bbox = (139.749, 35.663, 139.785, 35.699)  # minLon,minLat,maxLon,maxLat
 time_code = 202506040900  # YYYYMMDDhhmm, 5分単位
 url = (
@@ -13,6 +19,6 @@ url = (
     f"AND BBOX(\"ジオメトリ\",{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]},'EPSG:4326')"
 )
 r = requests.get(url)
-features = r.json()["features"]
-df = pd.json_normalize([f["properties"] for f in features])
+features = loads(r.content)["features"]  # orjsonでバイト列を直接パース
+df = pd.DataFrame([f["properties"] for f in features])  # propertiesは平坦なのでjson_normalize不要
 print(df.head())
\ No newline at end of file
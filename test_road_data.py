@@ -0,0 +1,45 @@
+"""Regression tests for road_data.RoadDataLoader"""
+import sys
+import os
+import shutil
+import tempfile
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from road_data import RoadDataLoader
+from config import BBOX_5KM, ROAD_DATA_ZIP
+
+ROAD_ZIP_PATH = Path(os.path.dirname(os.path.abspath(__file__))) / ROAD_DATA_ZIP
+
+
+def test_bundled_zip_loads_roads_in_bbox():
+    """The bundled KSJ ZIP (no .prj) must yield roads for BBOX_5KM"""
+    assert ROAD_ZIP_PATH.exists(), f"Bundled road data missing: {ROAD_ZIP_PATH}"
+
+    # Copy the ZIP so the shapefile path is exercised (no Parquet cache next to it)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = Path(tmp_dir) / ROAD_ZIP_PATH.name
+        shutil.copy(ROAD_ZIP_PATH, zip_path)
+
+        loader = RoadDataLoader()
+        roads = loader.load_road_network(zip_path, BBOX_5KM)
+        assert not roads.empty, "No roads loaded for BBOX_5KM"
+
+        # Second call is served from the in-memory cache with the same result
+        assert len(loader.load_road_network(zip_path, BBOX_5KM)) == len(roads)
+
+        # A fresh loader reads the bbox Parquet cache written by the first load
+        assert len(RoadDataLoader().load_road_network(zip_path, BBOX_5KM)) == len(roads)
+
+    assert roads.crs == 'EPSG:4326'
+
+    # Every returned road intersects the bbox
+    minx, miny, maxx, maxy = BBOX_5KM
+    bounds = roads.geometry.bounds
+    assert ((bounds['maxx'] >= minx) & (bounds['minx'] <= maxx)
+            & (bounds['maxy'] >= miny) & (bounds['miny'] <= maxy)).all()
+
+
+if __name__ == "__main__":
+    test_bundled_zip_loads_roads_in_bbox()
+    print("✅ Road data tests passed")
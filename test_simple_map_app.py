@@ -1,208 +1,190 @@
 """Simple test for simple_map_app.py functionality"""
+import ast
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+# Import required modules once (the error is reported by test_data_loading)
+try:
+    import shutil
+    import tempfile
+    from pathlib import Path
+    from traffic_data import TrafficDataFetcher
+    from road_data import RoadDataLoader
+    from spatial_processor import SpatialProcessor
+    from congestion_analyzer import CongestionAnalyzer
+    from config import BBOX_5KM, TMDU_CENTER, ROAD_DATA_ZIP
+    import pandas as pd
+    import numpy as np
+    _IMPORT_ERROR = None
+except ImportError as e:
+    _IMPORT_ERROR = e
+
 def test_data_loading():
     """Test the data loading functionality"""
-    try:
-        # Import required modules
-        from traffic_data import TrafficDataFetcher
-        from road_data import RoadDataLoader
-        from spatial_processor import SpatialProcessor
-        from congestion_analyzer import CongestionAnalyzer
-        from config import BBOX_5KM, TMDU_CENTER
-        import pandas as pd
-        import numpy as np
-        from datetime import datetime
-        
-        print("Testing data loading components...")
-        
-        # Test traffic data fetching with mock
-        print("1. Testing traffic data fetching...")
-        fetcher = TrafficDataFetcher(use_mock=True)
-        traffic_data = fetcher.fetch_traffic_data(BBOX_5KM)
-        
-        if traffic_data is not None and not traffic_data.empty:
-            print(f"   ✅ Traffic data: {len(traffic_data)} records")
-        else:
-            print("   ❌ Traffic data fetch failed")
-            return False
-        
-        # Test road data loading (will use cache or fail gracefully)
-        print("2. Testing road data loading...")
-        loader = RoadDataLoader()
-        try:
-            road_data = loader.load_road_network(bbox=BBOX_5KM)
-            if not road_data.empty:
-                print(f"   ✅ Road data: {len(road_data)} records")
-                has_road_data = True
-            else:
-                print("   ⚠️ Road data file not found, using fallback")
-                has_road_data = False
-        except Exception as e:
-            print(f"   ⚠️ Road data loading failed: {e}")
-            has_road_data = False
+    assert _IMPORT_ERROR is None, f"Import error: {_IMPORT_ERROR}"
+    
+    print("Testing data loading components...")
+    
+    # Test traffic data fetching with mock
+    print("1. Testing traffic data fetching...")
+    fetcher = TrafficDataFetcher(use_mock=True)
+    traffic_data = fetcher.fetch_traffic_data(BBOX_5KM)
+    assert traffic_data is not None and not traffic_data.empty, "Traffic data fetch failed"
+    print(f"   ✅ Traffic data: {len(traffic_data)} records")
+    
+    # Test road data loading (fallback only when the bundled ZIP is actually absent)
+    print("2. Testing road data loading...")
+    road_zip_path = Path(os.path.dirname(os.path.abspath(__file__))) / ROAD_DATA_ZIP
+    has_road_data = road_zip_path.exists()
+    if has_road_data:
+        # Load a copy so the Parquet cache is written outside the source tree
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zip_copy = Path(tmp_dir) / road_zip_path.name
+            shutil.copy(road_zip_path, zip_copy)
+            road_data = RoadDataLoader().load_road_network(zip_copy, BBOX_5KM)
+        assert not road_data.empty, f"No roads loaded from {road_zip_path} for BBOX_5KM"
+        print(f"   ✅ Road data: {len(road_data)} records")
+    else:
+        print(f"   ⚠️ Road data file not found ({road_zip_path}), using fallback")
+    
+    # Test spatial processing and congestion analysis
+    print("3. Testing data processing...")
+    processor = SpatialProcessor()
+    analyzer = CongestionAnalyzer()
+    
+    if has_road_data:
+        # Full pipeline test
+        joined_data = processor.join_traffic_roads(traffic_data, road_data)
+        assert not joined_data.empty, "Spatial join failed"
+        aggregated_data = processor.aggregate_by_road(joined_data, road_data)
+        assert not aggregated_data.empty, "Aggregation failed"
+        congestion_data = analyzer.calculate_congestion_level(aggregated_data)
+        print("   ✅ Full pipeline successful")
+    else:
+        # Test with traffic data only
+        congestion_data = analyzer.calculate_congestion_level(traffic_data)
+        assert not congestion_data.empty, "Traffic data analysis failed"
+        print("   ✅ Traffic data analysis successful")
+    
+    # Test statistics generation
+    print("4. Testing statistics generation...")
+    stats = analyzer.generate_statistics(congestion_data)
+    assert stats and 'total_roads' in stats, "Statistics generation failed"
+    print(f"   ✅ Statistics: {stats['total_roads']} roads analyzed")
+    
+    # Test fallback data creation
+    print("5. Testing fallback data creation...")
+    
+    def create_fallback_data():
+        """Fallback data generation (for processing failure)"""
+        rng = np.random.default_rng(42)
         
-        # Test spatial processing and congestion analysis
-        print("3. Testing data processing...")
-        processor = SpatialProcessor()
-        analyzer = CongestionAnalyzer()
+        # TMDU coordinates
+        center_lat, center_lon = TMDU_CENTER
         
-        if has_road_data and not road_data.empty:
-            # Full pipeline test
-            joined_data = processor.join_traffic_roads(traffic_data, road_data)
-            if not joined_data.empty:
-                aggregated_data = processor.aggregate_by_road(joined_data)
-                if not aggregated_data.empty:
-                    congestion_data = analyzer.calculate_congestion_level(aggregated_data)
-                    print("   ✅ Full pipeline successful")
-                else:
-                    print("   ❌ Aggregation failed")
-                    return False
-            else:
-                print("   ❌ Spatial join failed")
-                return False
-        else:
-            # Test with traffic data only
-            congestion_data = analyzer.calculate_congestion_level(traffic_data)
-            if not congestion_data.empty:
-                print("   ✅ Traffic data analysis successful")
-            else:
-                print("   ❌ Traffic data analysis failed")
-                return False
+        # Random road data generation: numeric columns share one buffer (one named row per column)
+        n_roads = 50
+        buf = np.empty((5, n_roads))
+        lat, lon, speeds, travel_time, link_length = buf
+        lat[:] = rng.normal(center_lat, 0.01, n_roads)
+        lon[:] = rng.normal(center_lon, 0.01, n_roads)
+        np.clip(rng.normal(25, 10, n_roads), 5, 60, out=speeds)  # 5-60km/h
+        travel_time[:] = rng.uniform(10, 60, n_roads)
+        link_length[:] = rng.uniform(50, 200, n_roads)
         
-        # Test statistics generation
-        print("4. Testing statistics generation...")
-        stats = analyzer.generate_statistics(congestion_data)
-        if stats and 'total_roads' in stats:
-            print(f"   ✅ Statistics: {stats['total_roads']} roads analyzed")
-        else:
-            print("   ❌ Statistics generation failed")
-            return False
+        # Congestion categories (classified in one vectorized pass)
+        conds = [speeds >= 30, speeds >= 20]
+        congestion = np.select(conds, ['空いている', 'やや混雑'], default='混雑')
+        congestion_level = np.select(conds, ['low', 'medium'], default='high')
         
-        # Test fallback data creation
-        print("5. Testing fallback data creation...")
+        df = pd.DataFrame(
+            buf.T, columns=['latitude', 'longitude', 'speed', 'travel_time', 'link_length'], copy=False
+        ).assign(
+            congestion=congestion,
+            congestion_level=congestion_level,
+            road_name=np.char.add('道路_', (np.arange(n_roads) + 1).astype(str)),
+            road_id=np.char.mod('R%03d', np.arange(n_roads)),
+            observation_count=rng.integers(1, 5, n_roads)
+        )
         
-        def create_fallback_data():
-            """Fallback data generation (for processing failure)"""
-            np.random.seed(42)
-            
-            # TMDU coordinates
-            center_lat, center_lon = TMDU_CENTER
-            
-            # Random road data generation
-            n_roads = 50
-            lats = np.random.normal(center_lat, 0.01, n_roads)
-            lons = np.random.normal(center_lon, 0.01, n_roads)
-            speeds = np.random.normal(25, 10, n_roads)
-            speeds = np.clip(speeds, 5, 60)  # 5-60km/h
-            
-            # Congestion categories
-            congestion = []
-            for speed in speeds:
-                if speed >= 30:
-                    congestion.append('空いている')
-                elif speed >= 20:
-                    congestion.append('やや混雑')
-                else:
-                    congestion.append('混雑')
-            
-            df = pd.DataFrame({
-                'latitude': lats,
-                'longitude': lons,
-                'speed': speeds,
-                'travel_time': np.random.uniform(10, 60, n_roads),
-                'link_length': np.random.uniform(50, 200, n_roads),
-                'congestion': congestion,
-                'congestion_level': ['low' if c == '空いている' else 'medium' if c == 'やや混雑' else 'high' for c in congestion],
-                'road_name': [f'道路_{i+1}' for i in range(n_roads)],
-                'road_id': [f'R{i:03d}' for i in range(n_roads)],
-                'observation_count': np.random.randint(1, 5, n_roads)
-            })
-            
-            # Simple statistics
-            stats = {
-                'total_roads': len(df),
-                'congestion_distribution': df['congestion_level'].value_counts().to_dict(),
-                'speed_stats': {
-                    'mean': float(df['speed'].mean()),
-                    'median': float(df['speed'].median()),
-                    'min': float(df['speed'].min()),
-                    'max': float(df['speed'].max())
-                }
+        # Simple statistics
+        stats = {
+            'total_roads': len(df),
+            'congestion_distribution': df['congestion_level'].value_counts().to_dict(),
+            'speed_stats': {
+                'mean': float(df['speed'].mean()),
+                'median': float(df['speed'].median()),
+                'min': float(df['speed'].min()),
+                'max': float(df['speed'].max())
             }
-            
-            return df, stats, None
-        
-        fallback_df, fallback_stats, _ = create_fallback_data()
-        if not fallback_df.empty:
-            print(f"   ✅ Fallback data: {len(fallback_df)} records")
-        else:
-            print("   ❌ Fallback data creation failed")
-            return False
+        }
         
-        print("\n✅ All data loading components are working correctly!")
-        return True
-        
-    except ImportError as e:
-        print(f"❌ Import error: {e}")
-        return False
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        return df, stats, None
+    
+    fallback_df, fallback_stats, _ = create_fallback_data()
+    assert not fallback_df.empty, "Fallback data creation failed"
+    print(f"   ✅ Fallback data: {len(fallback_df)} records")
+    
+    print("\n✅ All data loading components are working correctly!")
 
 def test_app_structure():
     """Test app structure without running streamlit"""
     print("\nTesting app structure...")
     
-    try:
-        # Check if the app file exists and can be parsed
-        app_file = "simple_map_app.py"
-        with open(app_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Check for key components
-        required_components = [
-            'load_real_traffic_data',
-            'create_fallback_data',
-            'main()',
-            'st.cache_data',
-            'TrafficDataFetcher',
-            'RoadDataLoader',
-            'SpatialProcessor',
-            'CongestionAnalyzer'
-        ]
-        
-        missing_components = []
-        for component in required_components:
-            if component not in content:
-                missing_components.append(component)
-        
-        if missing_components:
-            print(f"❌ Missing components: {missing_components}")
-            return False
-        else:
-            print("✅ All required components found in app file")
-            return True
-            
-    except FileNotFoundError:
-        print("❌ simple_map_app.py not found")
-        return False
-    except Exception as e:
-        print(f"❌ Error checking app structure: {e}")
-        return False
+    # Parse the app file next to this test
+    app_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simple_map_app.py")
+    with open(app_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    # Check for key components
+    required_components = [
+        'load_real_traffic_data',
+        'create_fallback_data',
+        'main()',
+        'st.cache_data',
+        'TrafficDataFetcher',
+        'RoadDataLoader',
+        'SpatialProcessor',
+        'CongestionAnalyzer'
+    ]
+    
+    # Collect identifiers in one AST walk (dotted/called components match on the last name)
+    names = set()
+    for node in ast.walk(ast.parse(content)):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            names.add(node.attr)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+    
+    missing_components = [
+        component for component in required_components
+        if component.rstrip('()').split('.')[-1] not in names
+    ]
+    
+    assert not missing_components, f"Missing components: {missing_components}"
+    print("✅ All required components found in app file")
 
 if __name__ == "__main__":
     print("🧪 Testing simple_map_app.py functionality...\n")
     
     # Test data loading
-    data_test = test_data_loading()
+    try:
+        test_data_loading()
+        data_test = True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        data_test = False
     
     # Test app structure
-    structure_test = test_app_structure()
+    try:
+        test_app_structure()
+        structure_test = True
+    except AssertionError as e:
+        print(f"❌ {e}")
+        structure_test = False
     
     # Summary
     print("\n📋 Test Summary:")
@@ -8,7 +8,7 @@ basic operations such as CRS conversion and nearest‐road
 search for traffic observation points.
 
 Requirements:
-    pip install geopandas pyproj shapely fiona rtree pandas
+    pip install geopandas pyproj shapely pyogrio pyarrow pandas
 
 Usage example:
     python tokyo_road_loader.py --zip N01-07L-13-01.0a_GML.zip \
@@ -19,9 +19,16 @@ Usage example:
 import argparse
 from pathlib import Path
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyogrio
+import shapely
+from pyproj import Transformer
 from shapely.geometry import Point
 
+# WGS84 -> Web Mercator, built once and reused for point coordinate arrays
+_TO_METRIC = Transformer.from_crs(4326, 3857, always_xy=True)
+
 
 def load_roads(zip_path: Path, shp_name: str = None) -> gpd.GeoDataFrame:
     """Load KSJ road centerline data from a ZIP archive.
@@ -29,7 +36,7 @@ def load_roads(zip_path: Path, shp_name: str = None) -> gpd.GeoDataFrame:
     Args:
         zip_path: Path to the KSJ ZIP file.
         shp_name: Optional shapefile name inside the ZIP.
-                  If None, the first .shp found is used.
+                  If None, the first layer in the archive is used.
 
     Returns:
         GeoDataFrame in EPSG:4326 with columns:
@@ -38,15 +45,12 @@ def load_roads(zip_path: Path, shp_name: str = None) -> gpd.GeoDataFrame:
             - road_name  (str)  KSJ N01_003
             - geometry   (LineString/MultiLineString)
     """
-    # Auto-detect shapefile if not provided
-    if shp_name is None:
-        with zipfile.ZipFile(zip_path) as zf:
-            shp_candidates = [m for m in zf.namelist() if m.lower().endswith('.shp')]
-            if not shp_candidates:
-                raise FileNotFoundError("No .shp file found in ZIP archive.")
-            shp_name = shp_candidates[0]
-
-    gdf = gpd.read_file(f"zip://{zip_path}!{shp_name}")
+    # Read through GDAL's /vsizip/ handler (no Python-side extraction);
+    # only the key attribute columns are read, via Arrow record batches
+    path = f"/vsizip/{zip_path}" if shp_name is None else f"/vsizip/{zip_path}/{shp_name}"
+    gdf = pyogrio.read_dataframe(
+        path, columns=["N01_001", "N01_002", "N01_003"], use_arrow=True
+    )
     # Convert JGD2000 (EPSG:4612) → WGS84 (EPSG:4326)
     gdf = gdf.to_crs(4326)
 
@@ -69,27 +73,55 @@ def load_obs(obs_csv: Path) -> gpd.GeoDataFrame:
     return gdf
 
 
+def build_road_index(gdf_roads: gpd.GeoDataFrame) -> shapely.STRtree:
+    """Build the nearest-road spatial index (roads in EPSG:3857).
+
+    Build it once per road network and pass it to attach_nearest_road
+    to reuse it across calls.
+
+    Args:
+        gdf_roads: roads (EPSG:4326)
+
+    Returns:
+        STRtree over the road geometries, in the same order as gdf_roads
+    """
+    return shapely.STRtree(gdf_roads.geometry.to_crs(3857).values)
+
+
 def attach_nearest_road(gdf_obs: gpd.GeoDataFrame,
                         gdf_roads: gpd.GeoDataFrame,
-                        max_distance_m: float = 20) -> gpd.GeoDataFrame:
+                        max_distance_m: float = 20,
+                        tree: shapely.STRtree = None) -> gpd.GeoDataFrame:
     """Spatially join nearest road_id to each observation point.
 
     Args:
         gdf_obs: observation points (EPSG:4326)
         gdf_roads: roads (EPSG:4326)
         max_distance_m: max planar distance in metres to accept match
+        tree: optional index from build_road_index(gdf_roads);
+              built on the fly if None
 
     Returns:
         gdf_obs with added 'road_id' column (NaN if no match)
     """
-    # Reproject to metric CRS for distance calculation
-    gdf_obs_m = gdf_obs.to_crs(3857)
-    gdf_roads_m = gdf_roads.to_crs(3857)
-    joined = gpd.sjoin_nearest(
-        gdf_obs_m, gdf_roads_m[["road_id", "geometry"]],
-        how="left", max_distance=max_distance_m
+    if tree is None:
+        tree = build_road_index(gdf_roads)
+
+    # Reproject points to metric CRS for distance calculation
+    # (coordinate arrays through PROJ)
+    x, y = _TO_METRIC.transform(shapely.get_x(gdf_obs.geometry.values),
+                                shapely.get_y(gdf_obs.geometry.values))
+    obs_m = shapely.points(x, y)
+
+    # Nearest road per point as paired positions (one match per point, ties -> first)
+    obs_idx, road_idx = tree.query_nearest(
+        obs_m, max_distance=max_distance_m, all_matches=False
     )
-    gdf_obs["road_id"] = joined["road_id"].values
+
+    # Take road_id by position; unmatched points keep NaN
+    road_id = np.full(len(gdf_obs), np.nan, dtype=object)
+    road_id[obs_idx] = gdf_roads["road_id"].to_numpy()[road_idx]
+    gdf_obs["road_id"] = road_id
     return gdf_obs
 
 